@@ -0,0 +1,202 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ROOT
+import json
+import os
+
+"""
+checkpointing of event loop scripts so a job which dies can be restarted from
+where it got to rather than from the beginning
+
+the output is written as a series of part files, one per checkpoint_every
+events, at each checkpoint the trees are written to the current part and
+moved to a new one and the accumulated state is saved:
+  * the contents of any histograms in the output directory, to <out>.ckpt.root
+  * the state of any registered objects (eg MenuPathRates), these must have
+    get_checkpoint_state() returning something json serialisable and
+    set_checkpoint_state(state)
+  * the next entry to process and the part files, to <out>.ckpt.json which is
+    written last so a checkpoint only exists once everything else is written
+
+on restart with the same arguments the state is restored and the loop carries
+on from the next entry, at the end the parts are merged into the output which
+is then identical to that of an uninterrupted run
+
+usage:
+    ckpt = Checkpointer(out_filename,in_filenames,checkpoint_every)
+    out_file = ckpt.open()
+    ...make the trees, histograms etc as normal...
+    ckpt.add_state("rates",rates)
+    for event in CoreTools.iter_events(events,ckpt.start()):
+        ...fill...
+        ckpt.event_done()
+    ...anything written at the end should go in ckpt.out_file...
+    ckpt.finish()
+"""
+
+class StateDict(dict):
+    """
+    a dict of simple accumulated values (counts, sums) which can be checkpointed
+    """
+    def get_checkpoint_state(self):
+        return dict(self)
+
+    def set_checkpoint_state(self,state):
+        self.clear()
+        self.update(state)
+
+class Checkpointer:
+    """
+       out_filename = the final output file
+       in_filenames = the input files, a checkpoint is only used if they match
+       checkpoint_every = number of events between checkpoints
+       entry_range = (first entry, nr entries) of the input to process or None for all
+    """
+    def __init__(self,out_filename,in_filenames,checkpoint_every=10000,entry_range=None):
+        self.out_filename = out_filename
+        self.in_filenames = [str(x) for x in in_filenames]
+        self.checkpoint_every = max(1,checkpoint_every)
+        self.entry_range = list(entry_range) if entry_range else [0,-1]
+        self.ckpt_filename = out_filename+".ckpt.json"
+        self.hists_filename = out_filename+".ckpt.root"
+        self.state_objs = {}
+        self.out_file = None
+        self.nr_done = 0
+        self.nr_since_ckpt = 0
+        self.part_filenames = []
+        self.saved = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.ckpt_filename):
+            return None
+        try:
+            with open(self.ckpt_filename) as f:
+                saved = json.load(f)
+        except ValueError:
+            print("Checkpointer: checkpoint {} is corrupted, starting from the beginning".format(self.ckpt_filename))
+            return None
+        if saved['in_filenames']!=self.in_filenames or saved['entry_range']!=self.entry_range or saved['checkpoint_every']!=self.checkpoint_every:
+            print("Checkpointer: checkpoint {} is for a different job, starting from the beginning".format(self.ckpt_filename))
+            return None
+        return saved
+
+    def _get_part_filename(self,partnr):
+        return "{}.part{}.root".format(self.out_filename,partnr)
+
+    def open(self):
+        """
+        opens the output file for the current part and makes it the current
+        directory, returns the file
+        """
+        if self.saved:
+            self.part_filenames = list(self.saved['part_filenames'])
+            self.nr_done = self.saved['nr_done']
+        self.out_file = ROOT.TFile(self._get_part_filename(len(self.part_filenames)),"RECREATE")
+        return self.out_file
+
+    def add_state(self,name,obj):
+        self.state_objs[name] = obj
+
+    def start(self):
+        """
+        restores the saved state if resuming, must be called after all the
+        histograms and state objects are made
+        returns the entry range to pass to CoreTools.iter_events
+        """
+        if self.saved:
+            print("Checkpointer: resuming after {} events from {}".format(self.nr_done,self.ckpt_filename))
+            for name,state in self.saved['states'].items():
+                self.state_objs[name].set_checkpoint_state(state)
+            self._restore_hists()
+        first_entry,nr_entries = self.entry_range
+        if nr_entries>=0:
+            nr_entries = max(0,nr_entries-self.nr_done)
+        return (first_entry+self.nr_done,nr_entries)
+
+    def _get_objs(self,class_name):
+        return [obj for obj in self.out_file.GetList() if obj.InheritsFrom(class_name)]
+
+    def _restore_hists(self):
+        if not os.path.exists(self.hists_filename):
+            return
+        hists_file = ROOT.TFile.Open(self.hists_filename,"READ")
+        for hist in self._get_objs("TH1"):
+            saved_hist = hists_file.Get(hist.GetName())
+            if saved_hist:
+                hist.Reset()
+                hist.Add(saved_hist)
+                hist.SetEntries(saved_hist.GetEntries())
+        hists_file.Close()
+        self.out_file.cd()
+
+    def _save_hists(self):
+        hists = self._get_objs("TH1")
+        if not hists:
+            return
+        tmp_filename = self.hists_filename+".tmp.root"
+        hists_file = ROOT.TFile(tmp_filename,"RECREATE")
+        for hist in hists:
+            hists_file.WriteTObject(hist,hist.GetName())
+        hists_file.Close()
+        os.rename(tmp_filename,self.hists_filename)
+        self.out_file.cd()
+
+    def _save(self):
+        saved = {
+            'in_filenames' : self.in_filenames,
+            'entry_range' : self.entry_range,
+            'checkpoint_every' : self.checkpoint_every,
+            'nr_done' : self.nr_done,
+            'part_filenames' : self.part_filenames,
+            'states' : {name : obj.get_checkpoint_state() for name,obj in self.state_objs.items()}
+        }
+        tmp_filename = self.ckpt_filename+".tmp"
+        with open(tmp_filename,"w") as f:
+            json.dump(saved,f)
+        os.rename(tmp_filename,self.ckpt_filename)
+
+    def checkpoint(self):
+        """
+        writes the trees to the current part and moves them to a new part
+        the histograms move with them but are only written at the end
+        """
+        old_file = self.out_file
+        self.part_filenames.append(old_file.GetName())
+        new_file = ROOT.TFile(self._get_part_filename(len(self.part_filenames)),"RECREATE")
+        old_file.cd()
+        for tree in self._get_objs("TTree"):
+            tree.Write()
+            tree.Reset()
+            tree.SetDirectory(new_file)
+        for hist in self._get_objs("TH1"):
+            hist.SetDirectory(new_file)
+        old_file.Close()
+        self.out_file = new_file
+        self.out_file.cd()
+        self._save_hists()
+        self._save()
+        self.nr_since_ckpt = 0
+
+    def event_done(self):
+        self.nr_done += 1
+        self.nr_since_ckpt += 1
+        if self.nr_since_ckpt>=self.checkpoint_every:
+            self.checkpoint()
+
+    def finish(self):
+        """
+        writes the last part, merges the parts into the output and removes the
+        checkpoint files
+        """
+        from Analysis.HLTAnalyserPy.ParallelRunner import merge_outputs
+        self.out_file.Write()
+        self.part_filenames.append(self.out_file.GetName())
+        self.out_file.Close()
+        self.out_file = None
+        if not merge_outputs(self.out_filename,self.part_filenames):
+            raise IOError("merging the parts {} into {} failed, the checkpoint is kept".format(self.part_filenames,self.out_filename))
+        for filename in self.part_filenames+[self.hists_filename,self.ckpt_filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
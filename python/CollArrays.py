@@ -0,0 +1,109 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+
+from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
+
+"""
+per event columnar snapshots of the track and cluster collections
+
+the quantities needed by the isolation and matching code (pt, eta, phi, vz etc)
+are read once per event into a numpy structured array, one field per quantity,
+so they can be used in vectorised expressions rather than calling into c++
+for every object for every e/gamma candidate
+
+by default the arrays are filled in a single call to a JIT compiled c++
+function (see JitAccessors), if that is not possible they are filled in python
+"""
+
+_trk_fields = [("pt","pt()"),("eta","eta()"),("phi","phi()"),("vz","vz()")]
+_l1trk_fields = [("pt","ttTrk().momentum().perp()"),("eta","ttTrk().eta()"),
+                 ("phi","ttTrk().phi()"),("vz","ttTrk().z0()")]
+_clus_fields = [("pt","pt()"),("energy","energy()"),("eta","eta()"),
+                ("phi","phi()"),("seed_id","seed().rawId()")]
+
+coll_fields = {
+    "trksv0" : _trk_fields,
+    "trksv2" : _trk_fields,
+    "trksv6" : _trk_fields,
+    "trksv72" : _trk_fields,
+    "l1trks" : _l1trk_fields,
+    "ecalpfclus" : _clus_fields,
+    "hcalpfclus" : _clus_fields,
+    "hgpfclus" : _clus_fields,
+}
+
+use_jit = True
+
+def _get_obj_type(prod_type):
+    """
+    returns the type of the objects in a std::vector product
+    """
+    prefix = "std::vector<"
+    if not prod_type.startswith(prefix) or not prod_type.endswith(">"):
+        raise ValueError("product type {} is not a std::vector".format(prod_type))
+    return prod_type[len(prefix):-1].strip()
+
+class CollArrayMaker:
+    """
+    makes the structured array for a collection, the fields are a list of
+    (field name, UnaryFunc string expression)
+    the c++ function is only compiled on the first use, if it can not be 
+    compiled or evaluated the arrays are filled in python from then on
+    """
+    def __init__(self,fields,obj_type=None,jit=True):
+        self.fields = list(fields)
+        self.dtype = numpy.dtype([(name,numpy.float64) for name,expr in self.fields])
+        self.obj_type = obj_type
+        self.jit = jit and obj_type is not None
+        self.accessor = None
+        self.funcs = [UnaryFunc(expr).compiled for name,expr in self.fields]
+
+    def _get_accessor(self):
+        if self.accessor is None:
+            from Analysis.HLTAnalyserPy.JitAccessors import JitAccessor
+            self.accessor = JitAccessor(self.obj_type,[expr for name,expr in self.fields])
+        return self.accessor
+
+    def __call__(self,coll):
+        arr = numpy.zeros(coll.size(),dtype=self.dtype)
+        if self.jit:
+            try:
+                vals = self._get_accessor().evaluate_coll(coll)
+                for fieldnr,(name,expr) in enumerate(self.fields):
+                    arr[name] = vals[fieldnr]
+                return arr
+            except Exception as err:
+                print("CollArrayMaker: could not use the JIT compiled accessor for {}, filling in python\n  {}".format(self.obj_type,err))
+                self.jit = False
+                self.accessor = None
+        for fieldnr,(name,expr) in enumerate(self.fields):
+            func = self.funcs[fieldnr]
+            arr[name] = numpy.fromiter((func(obj) for obj in coll),dtype=numpy.float64,count=len(arr))
+        return arr
+
+_makers = {}
+
+def _get_maker(evtdata,coll_name):
+    if coll_name not in _makers:
+        if coll_name not in coll_fields:
+            raise ValueError("no array fields defined for {}, known collections are {}".format(coll_name,list(coll_fields.keys())))
+        obj_type = _get_obj_type(getattr(evtdata.handles,coll_name).prod_type)
+        _makers[coll_name] = CollArrayMaker(coll_fields[coll_name],obj_type,jit=use_jit)
+    return _makers[coll_name]
+
+def get_coll_arrays(evtdata,coll_name):
+    """
+    returns the structured array of coll_name for the current event, the array
+    is made on first request and cached for the rest of the event
+    an invalid product gives an empty array
+    """
+    def make_arrays(evtdata):
+        maker = _get_maker(evtdata,coll_name)
+        coll = evtdata.get(coll_name)
+        if coll is None:
+            return numpy.zeros(0,dtype=maker.dtype)
+        return maker(coll)
+    return evtdata.get_derived(("coll_arrays",coll_name),make_arrays)
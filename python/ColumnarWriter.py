@@ -0,0 +1,206 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+from array import array
+import numpy
+
+"""
+an alternative output backend for the ntuple makers which writes the branches
+as columns to a parquet or arrow IPC file rather than a TTree
+
+ColumnarTree has the same Branch/Fill/Write interface as a TTree that TreeVar
+and the trees use so it can be passed in place of the TTree, the same variable
+definitions then give the same columns with array branches becoming
+jagged (list) columns
+
+requires pyarrow
+"""
+
+out_formats = {"parquet" : ".parquet","arrow" : ".arrow"}
+
+#types of std::vector elements we know how to convert to arrow types
+_cpp_to_numpy_types = {
+    "float" : numpy.float32,
+    "double" : numpy.float64,
+    "int" : numpy.int32,
+    "unsigned int" : numpy.uint32,
+    "short" : numpy.int16,
+    "unsigned short" : numpy.uint16,
+    "char" : numpy.int8,
+    "unsigned char" : numpy.uint8,
+    "bool" : numpy.bool_,
+    "long" : numpy.int64,
+    "unsigned long" : numpy.uint64,
+}
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("the columnar output formats {} require pyarrow".format(list(out_formats.keys())))
+    return pyarrow
+
+def get_columnar_filename(filename,out_format):
+    """
+    swaps the extension of filename (eg output.root) to that of the format
+    """
+    if out_format not in out_formats:
+        raise ValueError("output format {} not known, valid formats are {}".format(out_format,list(out_formats.keys())))
+    return os.path.splitext(filename)[0]+out_formats[out_format]
+
+class ColumnarBranch:
+    """
+    stores the values of a branch for each entry until they are flushed
+    supports the same inputs as the TTree branches in this package:
+       array.array with a leaflist, optionally with [sizevar] or [N] for arrays
+       std::vector, std::string and TBits objects
+    the values are read from the object when the tree is filled
+    """
+    def __init__(self,name,data,leaflist=None):
+        self.name = name
+        self.data = data
+        self.sizevar = None
+        self.fixed_size = None
+        self.np_type = None
+        if isinstance(data,array):
+            self.kind = "array"
+            self.np_type = numpy.dtype(data.typecode)
+            match = re.search(r"\[(\w+)\]",leaflist or "")
+            if match and match.group(1).isdigit():
+                self.fixed_size = int(match.group(1))
+            elif match:
+                self.sizevar = match.group(1)
+        elif hasattr(data,"TestBitNumber"):
+            self.kind = "bits"
+            self.np_type = numpy.dtype(numpy.bool_)
+        elif hasattr(data,"c_str"):
+            self.kind = "string"
+        elif hasattr(data,"size") and hasattr(data,"__getitem__"):
+            self.kind = "vector"
+            value_type = getattr(data,"value_type",None)
+            if value_type in _cpp_to_numpy_types:
+                self.np_type = numpy.dtype(_cpp_to_numpy_types[value_type])
+        else:
+            raise ValueError("branch {} of type {} can not be written to a columnar file".format(name,type(data)))
+        self.values = []
+
+    def SetAddress(self,data):
+        self.data = data
+
+    def is_jagged(self):
+        return self.kind in ("bits","vector") or self.sizevar or self.fixed_size
+
+    def snapshot(self,tree):
+        if self.kind=="array":
+            if self.sizevar or self.fixed_size:
+                nr_vals = self.fixed_size if self.fixed_size else int(tree.branches[self.sizevar].data[0])
+                self.values.append(numpy.frombuffer(self.data,dtype=self.np_type,count=nr_vals).copy())
+            else:
+                self.values.append(self.data[0])
+        elif self.kind=="bits":
+            self.values.append(numpy.array([self.data.TestBitNumber(bitnr) for bitnr in range(self.data.GetNbits())],dtype=self.np_type))
+        elif self.kind=="string":
+            self.values.append(str(self.data))
+        elif self.np_type is not None:
+            self.values.append(numpy.array(list(self.data),dtype=self.np_type))
+        else:
+            self.values.append([str(val) if hasattr(val,"c_str") else val for val in self.data])
+
+    def to_arrow(self,pyarrow):
+        if self.is_jagged() and self.np_type is not None:
+            #build the list column directly from the offsets and flattened values
+            offsets = numpy.zeros(len(self.values)+1,dtype=numpy.int32)
+            numpy.cumsum([len(vals) for vals in self.values],out=offsets[1:])
+            flat = numpy.concatenate(self.values) if self.values else numpy.zeros(0,dtype=self.np_type)
+            arrow_vals = pyarrow.ListArray.from_arrays(pyarrow.array(offsets),pyarrow.array(flat.astype(self.np_type,copy=False)))
+        elif self.np_type is not None:
+            arrow_vals = pyarrow.array(numpy.array(self.values,dtype=self.np_type))
+        else:
+            arrow_vals = pyarrow.array(self.values)
+        self.values = []
+        return arrow_vals
+
+class ColumnarTree:
+    """
+    a stand in for a TTree which writes to a parquet or arrow IPC file
+       name = name of the tree, stored in the file metadata
+       filename = output filename
+       out_format = "parquet" or "arrow"
+       flush_every = the number of entries buffered before they are written,
+                     each flush is a row group (parquet) or record batch (arrow)
+    Write() must be called at the end to write the remaining entries and close the file
+    """
+    def __init__(self,name,filename,out_format="parquet",flush_every=10000):
+        if out_format not in out_formats:
+            raise ValueError("output format {} not known, valid formats are {}".format(out_format,list(out_formats.keys())))
+        self.pyarrow = _import_pyarrow()
+        self.name = name
+        self.filename = filename
+        self.out_format = out_format
+        self.flush_every = flush_every
+        self.branches = {}
+        self.branch_order = []
+        self.nr_entries = 0
+        self.nr_buffered = 0
+        self.schema = None
+        self.writer = None
+
+    def Branch(self,name,data,leaflist=None):
+        if name in self.branches:
+            raise ValueError("branch {} already exists in {}".format(name,self.name))
+        branch = ColumnarBranch(name,data,leaflist)
+        self.branches[name] = branch
+        self.branch_order.append(name)
+        return branch
+
+    def Fill(self):
+        for name in self.branch_order:
+            self.branches[name].snapshot(self)
+        self.nr_entries += 1
+        self.nr_buffered += 1
+        if self.nr_buffered>=self.flush_every:
+            self.flush()
+
+    def GetEntries(self):
+        return self.nr_entries
+
+    def flush(self):
+        if self.nr_buffered==0:
+            return
+        pyarrow = self.pyarrow
+        columns = [self.branches[name].to_arrow(pyarrow) for name in self.branch_order]
+        if self.schema is None:
+            table = pyarrow.Table.from_arrays(columns,names=self.branch_order)
+            self.schema = table.schema.with_metadata({"tree_name" : self.name})
+            table = table.replace_schema_metadata(self.schema.metadata)
+            if self.out_format=="parquet":
+                self.writer = pyarrow.parquet.ParquetWriter(self.filename,self.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.filename,self.schema)
+        else:
+            table = pyarrow.Table.from_arrays(columns,names=self.branch_order).cast(self.schema)
+        self.writer.write_table(table)
+        self.nr_buffered = 0
+
+    def Write(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+def read_columnar(filename):
+    """
+    reads a file written by ColumnarTree into a pyarrow.Table, the file is
+    memory mapped and for arrow IPC files the columns are not copied
+    use .to_pandas() or .column(name).to_numpy() for analysis
+    """
+    pyarrow = _import_pyarrow()
+    if filename.endswith(out_formats["parquet"]):
+        return pyarrow.parquet.read_table(filename,memory_map=True)
+    else:
+        return pyarrow.ipc.open_file(pyarrow.memory_map(filename,"r")).read_all()
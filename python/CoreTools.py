@@ -7,6 +7,7 @@ import sys
 import re
 from enum import Enum
 import functools
+import operator
 import os
 import importlib
 
@@ -43,11 +44,12 @@ def convert_args(input_args):
         arg = arg.rstrip().lstrip()
         try:
             output_args.append(int(arg))
-            break
+            continue
         except ValueError:
             pass
         try: 
             output_args.append(float(arg))
+            continue
         except ValueError:
             pass
         if arg.startswith('"') and arg.endswith('"'):
@@ -63,6 +65,7 @@ class UnaryStrFunc:
         self.name = res[0]
         self.iscallable = res[1]
         self.args = res[2]
+        self.compiled = self._compile()
 
     def _convert(self,func_str):
         """
@@ -97,26 +100,48 @@ class UnaryStrFunc:
 
         raise RuntimeError("function string {} could not be resolved".format(func_str))
 
-    def __call__(self,obj):
+    def _compile(self):
+        """
+        makes a single callable doing the attribute lookup / method call, 
+        operator.attrgetter/methodcaller do this in C so are much faster than 
+        a getattr and call in python
+        """
         if not self.iscallable:
-            return getattr(obj,self.name)
-        else :
-            return getattr(obj,self.name)(*self.args)
+            return operator.attrgetter(self.name)
+        else:
+            return operator.methodcaller(self.name,*self.args)
+
+    def __call__(self,obj):
+        return self.compiled(obj)
         
 
+def _compose(first,second):
+    return lambda obj : second(first(obj))
+
 class ChainedUnaryStrFunc:
     """
     this simple class defines a chain of functions/methods via a string
     basically allows us to stop intepreting "obj.method1(args).member1" and similar
     each time and just save the results
+
+    the chain is compiled once into a single callable, if it is only member
+    variables this is a single attrgetter otherwise its the composition of 
+    the individual method callers
     """
     def __init__(self,func_str):
         self.funcs = [UnaryStrFunc(s) for s in func_str.split(".")]
+        self.compiled = self._compile()
+
+    def _compile(self):
+        if not any(func.iscallable for func in self.funcs):
+            return operator.attrgetter(".".join(func.name for func in self.funcs))
+        compiled = self.funcs[0].compiled
+        for func in self.funcs[1:]:
+            compiled = _compose(compiled,func.compiled)
+        return compiled
             
     def __call__(self,obj):
-        for func in self.funcs:
-            obj = func(obj)
-        return obj
+        return self.compiled(obj)
         
 def call_func(obj,func_str):
     """
@@ -131,6 +156,42 @@ def call_func(obj,func_str):
     """
     return ChainedUnaryStrFunc(func_str)(obj)
 
+def get_cache_dir():
+    """
+    returns the directory for the persistent caches (event indices, file metadata, etc)
+    this is $HLTANALYSERPY_CACHE if set otherwise ~/.cache/hltanalyserpy
+    the directory is created if it does not exist
+    """
+    cache_dir = os.environ.get("HLTANALYSERPY_CACHE",os.path.join(os.path.expanduser("~"),".cache","hltanalyserpy"))
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+def get_local_filename(filename):
+    """
+    strips the "file:" prefix so we can check the file on disk, returns None for
+    remote (eg root://) files 
+    """
+    if filename.startswith("file:"):
+        return filename[len("file:"):]
+    elif filename.find("://")!=-1:
+        return None
+    else:
+        return filename
+
+def get_file_stats(filename):
+    """
+    returns the (mtime,size) of a file used to check if a cached result for the 
+    file is still valid, returns (None,None) for remote files which 
+    are assumed not to change
+    """
+    local_filename = get_local_filename(filename)
+    if local_filename and os.path.exists(local_filename):
+        stat = os.stat(local_filename)
+        return stat.st_mtime,stat.st_size
+    else:
+        return None,None
+
 def get_filenames(input_filenames,prefix=""):
     output_filenames = []
     for filename in input_filenames:
@@ -156,6 +217,21 @@ def get_filenames_vec(input_filenames,prefix=""):
 
 
 
+def iter_events(events,entry_range=None):
+    """
+    iterates over the events, if entry_range (first entry, nr entries) is given
+    only over those entries, nr entries <0 is to the end
+    """
+    if not entry_range:
+        for event in events:
+            yield event
+        return
+    first_entry,nr_entries = entry_range
+    last_entry = events.size() if nr_entries<0 else min(first_entry+nr_entries,events.size())
+    for entry in range(first_entry,last_entry):
+        events.to(entry)
+        yield events
+
 class UnaryFunc:
     """
     this is a simple class which allows us to define a unary function 
@@ -180,19 +256,40 @@ class UnaryFunc:
             self.func_type = UnaryFunc.FuncType.partial_
         else:
             self.func_type = UnaryFunc.FuncType.default
+        self.compiled = self._compile()
 
-
-    def __call__(self,obj):
+    def _compile(self):
+        """
+        decides the dispatch once here rather than on every call and returns
+        a callable taking just the object
+        """
         if self.func_type==UnaryFunc.FuncType.str_:
-            return self.func(obj)
+            return self.func.compiled
         #here we work around the fact we need to put the object as the first
         #argument to the function when using partial
         elif self.func_type==UnaryFunc.FuncType.partial_: 
-            return self.func.func(obj,*self.func.args,**self.func.keywords)
-        elif self.func_type==UnaryFunc.FuncType.default:
-            return self.func(obj)
+            func = self.func.func
+            args = self.func.args
+            keywords = self.func.keywords
+            if keywords:
+                return lambda obj : func(obj,*args,**keywords)
+            elif not args:
+                return func
+            elif len(args)==1:
+                arg0 = args[0]
+                return lambda obj : func(obj,arg0)
+            elif len(args)==2:
+                arg0,arg1 = args
+                return lambda obj : func(obj,arg0,arg1)
+            else:
+                return lambda obj : func(obj,*args)
+        elif isinstance(self.func,UnaryFunc):
+            return self.func.compiled
         else:
-            raise ValueError("error, func_type {} not known".func_type)
+            return self.func
+
+    def __call__(self,obj):
+        return self.compiled(obj)
 
 
 def get_best_dr_match(obj_to_match,coll,max_dr):
@@ -208,3 +305,49 @@ def get_best_dr_match(obj_to_match,coll,max_dr):
     return matched_obj
         
             
+
+class ObjMemo:
+    """
+    a per event store of quantities derived from individual objects (eg the 
+    best gsf track index of an e/gamma object) so they are computed once per 
+    object and then reused by every variable which needs them
+
+    the entries are keyed by the object and the quantity name, a reference to
+    the object is kept so its id can not be reused by another object while
+    the entry exists
+    EvtData.get_handles clears the store for each new event, as a safety net
+    for loops not using EvtData it also clears itself if it grows beyond max_objs
+    """
+    def __init__(self,max_objs=100000):
+        self.max_objs = max_objs
+        self.entries = {}
+
+    def clear(self):
+        self.entries = {}
+
+    def get(self,obj,key,make_func):
+        """
+        returns the quantity key for obj, calling make_func(obj) to make it 
+        if it does not exist yet
+        """
+        entry = self.entries.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            if len(self.entries)>=self.max_objs:
+                self.clear()
+            entry = (obj,{})
+            self.entries[id(obj)] = entry
+        vals = entry[1]
+        try:
+            return vals[key]
+        except KeyError:
+            val = make_func(obj)
+            vals[key] = val
+            return val
+
+obj_memo = ObjMemo()
+
+def memoise(obj,key,make_func):
+    """
+    shortcut for obj_memo.get, see ObjMemo
+    """
+    return obj_memo.get(obj,key,make_func)
@@ -3,8 +3,10 @@ import Analysis.HLTAnalyserPy.CoreTools as CoreTools
 import Analysis.HLTAnalyserPy.TrigTools as TrigTools
 import Analysis.HLTAnalyserPy.GenTools as GenTools
 import Analysis.HLTAnalyserPy.L1Tools as L1Tools
+import Analysis.HLTAnalyserPy.MatchTools as MatchTools
 from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
 from Analysis.HLTAnalyserPy.NtupTools import TreeVar
+import Analysis.HLTAnalyserPy.NtupSchema as NtupSchema
 from Analysis.HLTAnalyserPy.EvtWeights import EvtWeights
 
 from functools import partial
@@ -57,65 +59,19 @@ class EgHLTRun3Tree:
         #self.pthats = TreeVar(self.tree,"ptHats/F",None,maxsize=max_pthats,sizevar="nrPtHats")
             
         egobjnr_name = "nrEgs"
-        max_egs = 200    
+        max_egs = 20 #initial size, grows if needed
         self.egobj_nr = TreeVar(self.tree,egobjnr_name+"/i",UnaryFunc(partial(len)))
        
         prod_tag = "" if self.l1seeded else "Unseeded" 
 
-        vars_ = {
-            'et/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.et)),
-            'energy/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.energy)),
-            'rawEnergy/F' : UnaryFunc("superCluster().rawEnergy()"),
-            'eta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.eta)),
-            'phi/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.phi)),
-            'phiWidth/F':UnaryFunc("superCluster().phiWidth()"),
-            'nrClus/I':UnaryFunc("superCluster().clusters().size()"),
-            'seedId/i':UnaryFunc("superCluster().seed().seed().rawId()"),
-            'seedDet/I':UnaryFunc("superCluster().seed().seed().det()"),
-            'sigmaIEtaIEta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaClusterShape{}_sigmaIEtaIEta5x5".format(prod_tag),0)),
-            'sigmaIEtaIEtaNoise/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaClusterShape{}_sigmaIEtaIEta5x5NoiseCleaned".format(prod_tag),0)),
-            'ecalPFIsol/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaEcalPFClusterIso{}".format(prod_tag),0)),
-            'hcalPFIsol/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaHcalPFClusterIso{}".format(prod_tag),0)),
-            'trkIsol/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaEleGsfTrackIso{}".format(prod_tag),0)),
-            'trkChi2/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_Chi2".format(prod_tag),0)),
-            'trkMissHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_MissingHits".format(prod_tag),0)),
-            'trkValidHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_ValidHits".format(prod_tag),0)),
-            'invESeedInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_OneOESeedMinusOneOP".format(prod_tag),0)),
-            'invEInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_OneOESuperMinusOneOP".format(prod_tag),0)),
-            'trkDEta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_Deta".format(prod_tag),0)),
-            'trkDEtaSeed/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_DetaSeed".format(prod_tag),0)),
-            'trkDPhi/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_Dphi".format(prod_tag),0)), 
-            'trkNrLayerIT/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaGsfTrackVars{}_NLayerIT'.format(prod_tag),0)),
-            'pms2/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaPixelMatchVars{}_s2'.format(prod_tag),0)),
-            'hcalHForHoverE/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHoverE{}'.format(prod_tag),0)), 
-            
-            'bestTrkChi2/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_Chi2'.format(prod_tag),0)),
-            'bestTrkDEta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_Deta'.format(prod_tag),0)),
-            'bestTrkDEtaSeed/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_DetaSeed'.format(prod_tag),0)),
-            'bestTrkDPhi/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_Dphi'.format(prod_tag),0)),
-            'bestTrkMissHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_MissingHits'.format(prod_tag),0)),
-            'bestTrkNrLayerIT/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_NLayerIT'.format(prod_tag),0)),
-            'bestTrkESeedInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_OneOESeedMinusOneOP'.format(prod_tag),0)),
-            'bestTrkInvEInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_OneOESuperMinusOneOP'.format(prod_tag),0)),
-            'bestTrkValitHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_ValidHits'.format(prod_tag),0)),         
-        }
-        vars_.update(self.eg_extra_vars)
-
+        #the standard e/gamma and gen branches are defined in data/egHLTRun3Tree.json
+        schema = NtupSchema.compile_schema(NtupSchema.load_schema("egHLTRun3Tree.json"),{"prod_tag" : prod_tag})
+        self.egobj_plan = NtupSchema.CollFillPlan(self.tree,schema["eg"],"eg_",egobjnr_name,max_egs,exclude=self.eg_extra_vars)
         self.egobj_vars = []        
-        for name,func in six.iteritems(vars_):
+        for name,func in six.iteritems(self.eg_extra_vars):
             self.egobj_vars.append(TreeVar(self.tree,"eg_"+name,func,max_egs,egobjnr_name))
             
-        gen_vars_names = {
-            'energy/F' : UnaryFunc(partial(ROOT.reco.GenParticle.energy)),
-            'pt/F' : UnaryFunc(partial(ROOT.reco.GenParticle.pt)),
-            'et/F' : UnaryFunc(partial(ROOT.reco.GenParticle.et)),
-            'eta/F' : UnaryFunc(partial(ROOT.reco.GenParticle.eta)),
-            'phi/F' : UnaryFunc(partial(ROOT.reco.GenParticle.phi)),
-            'vz/F' : UnaryFunc(partial(ROOT.reco.GenParticle.vz)),
-        }
-        self.gen_vars = []
-        for name,func in six.iteritems(gen_vars_names):
-            self.gen_vars.append(TreeVar(self.tree,"eg_gen_"+name,func,max_egs,egobjnr_name))
+        self.gen_plan = NtupSchema.CollFillPlan(self.tree,schema["gen"],"eg_gen_",egobjnr_name,max_egs)
         
         l1eg_vars_names = {
             'et/F' : UnaryFunc("et()"),
@@ -178,28 +134,23 @@ class EgHLTRun3Tree:
         l1egs  = self.evtdata.get("l1egamma")
 
         self.egobj_nr.fill(egobjs)
-        for var_ in itertools.chain(self.gen_vars,self.l1eg_vars):
-            var_.clear()
         
         gen_eles = GenTools.get_genparts(self.evtdata.get("genparts"),
                                          pid=11,antipart=True,
                                          status=GenTools.PartStatus.PREFSR)
        
 
-        for objnr,obj in enumerate(egobjs):
-            for var_ in self.egobj_vars:                
-                var_.fill(obj,objnr)
+        gen_matches = MatchTools.get_best_dr_matches(egobjs,gen_eles,0.1)
+        l1eg_matches = MatchTools.get_best_dr_matches(egobjs,l1egs,0.2)
 
-            gen_obj = CoreTools.get_best_dr_match(obj,gen_eles,0.1)
-            if gen_obj:
-                for var_ in self.gen_vars:
-                    var_.fill(gen_obj,objnr)
+        #each variable is filled for all objects at once, unmatched objects are filled with 0
+        self.egobj_plan.fill(egobjs)
+        for var_ in self.egobj_vars:
+            var_.fill_from(egobjs)
+        self.gen_plan.fill(gen_matches)
+        for var_ in self.l1eg_vars:
+            var_.fill_from(l1eg_matches)
 
-            l1eg_obj = CoreTools.get_best_dr_match(obj,l1egs,0.2)
-            if l1eg_obj:
-                for var_ in self.l1eg_vars:
-                    var_.fill(l1eg_obj,objnr)
-                    
 
         self.trig_res.fill(self.evtdata)
         for var_ in self.trig_vars:
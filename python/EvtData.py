@@ -3,7 +3,11 @@ from __future__ import division
 from __future__ import print_function
 
 from DataFormats.FWLite import Events, Handle
-import six
+import ROOT
+import timeit
+
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+from Analysis.HLTAnalyserPy.EvtIndex import to_event
 
 """
 note to self:
@@ -18,9 +22,22 @@ ROOT.edm.EventBase.getByLabel(events.object().event(),ROOT.edm.InputTag("hltGtSt
 class HandleData(Handle):
     def __init__(self,product,label):
         Handle.__init__(self,product)
+        self.prod_type = str(product)
         self.label = str(label)
     def get(self,event):
         event.getByLabel(self.label,self)
+    def get_branch_key(self):
+        """
+        returns a key which sorts handles in the same order as their branches in 
+        the Events tree, this is (friendly class name, module, instance, process)
+        which is how the edm::ProductRegistry orders them
+        if the friendly name is not availible we fall back on the raw type
+        """
+        try:
+            friendly_type = str(ROOT.edm.friendlyname.friendlyName(self.prod_type))
+        except AttributeError:
+            friendly_type = self.prod_type
+        return (friendly_type,) + self.get_label(split=True)
     def get_label(self,split=True):
         if split:
             parts = self.label.split(":")
@@ -31,30 +48,145 @@ class HandleData(Handle):
             return str(self.label)
         
 class EvtHandles:
+    """
+    holds a handle for each product, accessed as an attribute with the product name
+    
+    the handles are only constructed when first accessed as making a Handle
+    requires looking up its type which is slow for the heavier templated types
+    and most jobs only use a small fraction of the products they declare
+    """
     def __init__(self,products=[],verbose=False):
+        self._products = {}
         for product in products:
             if verbose:
                 print("adding handle {name}, {type}, {tag}".format(**product))
-            setattr(self,product['name'],HandleData(product['type'],product['tag']))
+            self._products[product['name']] = product
+
+    def __getattr__(self,name):
+        #only called when the attribute doesnt exist, ie the handle has not yet been made
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            product = self._products[name]
+        except KeyError:
+            raise AttributeError("no product with name {} declared".format(name))
+        handle = HandleData(product['type'],product['tag'])
+        setattr(self,name,handle)
+        return handle
+
+    def names(self):
+        """returns the names of all the declared products"""
+        return list(self._products.keys())
     
 class EvtData:
+    class ProductProfile:
+        """
+        access statistics of a single product for the profiling mode
+        """
+        def __init__(self,name):
+            self.name = name
+            self.nr_gets = 0
+            self.get_time = 0.
+            self.product_time = 0.
+            self.nr_invalid = 0
+
+        def tot_time(self):
+            return self.get_time + self.product_time
+
     def __init__(self,products=[],verbose=False):
         self.handles = EvtHandles(products,verbose)
         self.event = None
-        self.got_handles = []
+        self.got_handles = set()
+        self.products = {}
+        self.derived = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.nr_learn_events = None
+        self.nr_events_seen = 0
+        self.used_handles = set()
+        self.prefetch_names = None
+        self.profiles = None
+
+    def enable_learned_prefetch(self,nr_learn_events=10):
+        """
+        in this mode, handles are got on demand for the first nr_learn_events
+        events while recording which products are actually used
+        after that, only the used products are got at the start of each event in 
+        a single pass in branch order, other products are still got on demand
+        and are added to the prefetch list if they are requested
+        """
+        self.nr_learn_events = nr_learn_events
+        self.nr_events_seen = 0
+        self.used_handles = set()
+        self.prefetch_names = None
+
+    def enable_profiling(self):
+        """
+        records for each product the number of getByLabel calls, the time spent
+        getting the handle and the product and the number of events the
+        product was invalid, see get_profile_report()
+        """
+        self.profiles = {}
+
+    def _get_profile(self,name):
+        try:
+            return self.profiles[name]
+        except KeyError:
+            self.profiles[name] = EvtData.ProductProfile(name)
+            return self.profiles[name]
+
+    def _fetch_handle(self,name,handle):
+        if self.profiles is None:
+            handle.get(self.event)
+        else:
+            start = timeit.default_timer()
+            handle.get(self.event)
+            profile = self._get_profile(name)
+            profile.get_time += timeit.default_timer() - start
+            profile.nr_gets += 1
+        self.got_handles.add(name)
+
+    def get_profile_report(self):
+        """
+        returns the profiling results as a string, sorted by total time spent
+        """
+        if self.profiles is None:
+            return "profiling not enabled"
+        lines = ["{:<30} {:>10} {:>12} {:>12} {:>12} {:>10}".format(
+            "product","nr gets","get time (s)","prod time (s)","tot time (s)","nr invalid")]
+        for profile in sorted(self.profiles.values(),key=lambda x : x.tot_time(),reverse=True):
+            lines.append("{p.name:<30} {p.nr_gets:>10d} {p.get_time:>12.3f} {p.product_time:>12.3f} {tot:>12.3f} {p.nr_invalid:>10d}".format(p=profile,tot=profile.tot_time()))
+        return "\n".join(lines)
+
+    def _set_prefetch_names(self):
+        key = lambda name : getattr(self.handles,name).get_branch_key()
+        self.prefetch_names = sorted(self.used_handles,key=key)
 
     def get_handles(self,event,on_demand=True):
         """ 
         gets the handles for the event
         if on_demand=True it doesnt actually get the handles and instead
         waits for something to request the handle
+        if learned prefetch is enabled, this overrides on_demand
+        
+        also clears the product cache and the per object memo store (CoreTools.obj_memo) 
+        of the previous event
         """ 
-        self.got_handles = []
+        self.got_handles = set()
+        self.products = {}
+        self.derived = {}
+        CoreTools.obj_memo.clear()
         self.event = event
-        if not on_demand:
-            for name,handle in six.iteritems(vars(self.handles)):            
-                handle.get(event)
-                self.got_handles.append(name)
+        if self.nr_learn_events is not None:
+            self.nr_events_seen += 1
+            if self.prefetch_names is None and self.nr_events_seen > self.nr_learn_events:
+                self._set_prefetch_names()
+            if self.prefetch_names is not None:
+                for name in self.prefetch_names:
+                    self._fetch_handle(name,getattr(self.handles,name))
+        elif not on_demand:
+            for name in self.handles.names():
+                self._fetch_handle(name,getattr(self.handles,name))
  
     def get_handle(self,name):
         """ 
@@ -63,9 +195,12 @@ class EvtData:
         """ 
         
         handle = getattr(self.handles,name)
-        if not name in self.got_handles:
-            handle.get(self.event)
-            self.got_handles.append(name)
+        if name not in self.got_handles:
+            self._fetch_handle(name,handle)
+            if self.nr_learn_events is not None and name not in self.used_handles:
+                self.used_handles.add(name)
+                if self.prefetch_names is not None:
+                    self._set_prefetch_names()
 
         return handle
 
@@ -73,37 +208,71 @@ class EvtData:
         """ 
         gets the product with name "name"
         now checks to ensure the handles are got first and not gets them
+
+        the product is cached for the rest of the event so repeated calls 
+        are just a dict lookup, invalid products are cached as None
         """ 
-        handle = self.get_handle(name)
-        
         try:
-            return handle.product()       
+            product = self.products[name]
+            self.cache_hits += 1
+            return product
+        except KeyError:
+            self.cache_misses += 1
+
+        handle = self.get_handle(name)        
+        if self.profiles is not None:
+            start = timeit.default_timer()
+        try:
+            product = handle.product()       
         except RuntimeError:
-            return None
+            product = None
+        if self.profiles is not None:
+            profile = self._get_profile(name)
+            profile.product_time += timeit.default_timer() - start
+            if product is None:
+                profile.nr_invalid += 1
+        self.products[name] = product
+        return product
            
     def get_fundtype(self,name,default=None):
          """
          hack as I needed this working right now(tm) and this was path of least resistance
          """
-         handle = self.get_handle(name)
-         
-         try:
-            if handle.isValid():
-                return handle.product()[0]       
-            else:
-                return default
-         except RuntimeError:
-             return None
+         product = self.get(name)
+         if product is not None:
+             return product[0]
+         else:
+             return default
+
+    def get_derived(self,key,make_func):
+        """
+        returns a quantity derived from the event products (eg a spatial index of a 
+        collection) keyed by key, it is made with make_func(evtdata) the first time it 
+        is requested in each event and then cached till the next call to get_handles
+        """
+        try:
+            return self.derived[key]
+        except KeyError:
+            self.derived[key] = make_func(self)
+            return self.derived[key]
+
+    def get_cache_stats(self):
+        """
+        returns the number of product cache hits and misses so far as a dict
+        """
+        return {"hits" : self.cache_hits, "misses" : self.cache_misses}
 
     def get_label(self,name,split=False): 
         return getattr(self.handles,name).get_label(split=split)
         
 
-def get_objs(evtdata,events,objname,indx):
+def get_objs(evtdata,events,objname,indx,evt_index=None):
     """
     A small helper function to save typing out this commands each time
+    if an EvtIndex is given, indx is instead the (run,lumi,event) of the event
     """
-    events.to(indx)
+    if not to_event(events,indx,evt_index):
+        return None
     evtdata.get_handles(events)
     objs = evtdata.get(objname)
     print("event: {} {} {}".format(events.eventAuxiliary().run(),events.eventAuxiliary().luminosityBlock(),events.eventAuxiliary().event()))
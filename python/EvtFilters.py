@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import Analysis.HLTAnalyserPy.TrigTools as TrigTools
+
+"""
+cheap event level selections which can be run before the expensive parts of 
+the event loop (filling trees etc) so rejected events never need to get the 
+heavy products such as tracks, clusters or rechits
+
+each filter is a callable taking the EvtData and returning True if the event passes
+"""
+
+class TrigFilter:
+    """
+    passes if any of the given triggers (matched by startswith as in TrigResults) pass
+    """
+    def __init__(self,trig_names,trig_res_name="trig_res"):
+        self.name = "trig({})".format(",".join(trig_names))
+        self.trig_names = list(trig_names)
+        self.trig_res = TrigTools.TrigResults(trig_names,trig_res_name)
+
+    def __call__(self,evtdata):
+        self.trig_res.fill(evtdata)
+        return any(self.trig_res.result(x) for x in self.trig_names)
+
+class NrEgObjsFilter:
+    """
+    passes if there are at least min_nr e/gamma trigger objects with et > min_et
+    """
+    def __init__(self,min_nr=1,min_et=0.,coll_name="egtrigobjs"):
+        self.name = "nrEgs({}>={} et>{})".format(coll_name,min_nr,min_et)
+        self.min_nr = min_nr
+        self.min_et = min_et
+        self.coll_name = coll_name
+
+    def __call__(self,evtdata):
+        egobjs = evtdata.get(self.coll_name)
+        if egobjs is None:
+            return False
+        nr_pass = 0
+        for egobj in egobjs:
+            if egobj.et()>self.min_et:
+                nr_pass += 1
+                if nr_pass>=self.min_nr:
+                    return True
+        return nr_pass>=self.min_nr
+
+class PtHatFilter:
+    """
+    passes if min_pthat <= generator pt hat < max_pthat
+    """
+    def __init__(self,min_pthat=0.,max_pthat=9999.):
+        self.name = "ptHat({}-{})".format(min_pthat,max_pthat)
+        self.min_pthat = min_pthat
+        self.max_pthat = max_pthat
+
+    def __call__(self,evtdata):
+        geninfo = evtdata.get("geninfo")
+        if geninfo is None:
+            return False
+        return self.min_pthat <= geninfo.qScale() < self.max_pthat
+
+class EvtPreFilter:
+    """
+    runs a list of filters in the order given, stopping at the first which fails
+    so the cheapest filters should be added first
+    it keeps track of how many events each filter was run on and passed
+    """
+    def __init__(self,filters=[]):
+        self.filters = []
+        self.nr_run = []
+        self.nr_pass = []
+        for filter_ in filters:
+            self.add_filter(filter_)
+
+    def add_filter(self,filter_):
+        self.filters.append(filter_)
+        self.nr_run.append(0)
+        self.nr_pass.append(0)
+
+    def __call__(self,evtdata):
+        for filtnr,filter_ in enumerate(self.filters):
+            self.nr_run[filtnr] += 1
+            if not filter_(evtdata):
+                return False
+            self.nr_pass[filtnr] += 1
+        return True
+
+    def get_checkpoint_state(self):
+        return {"nr_run" : self.nr_run,"nr_pass" : self.nr_pass}
+
+    def set_checkpoint_state(self,state):
+        self.nr_run = list(state["nr_run"])
+        self.nr_pass = list(state["nr_pass"])
+
+    def get_report(self):
+        lines = []
+        for filtnr,filter_ in enumerate(self.filters):
+            name = getattr(filter_,"name",str(filter_))
+            lines.append("{} : {} / {}".format(name,self.nr_pass[filtnr],self.nr_run[filtnr]))
+        return "\n".join(lines)
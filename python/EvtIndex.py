@@ -0,0 +1,150 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ROOT
+import bisect
+import hashlib
+import json
+import os
+
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+
+def read_evt_ids(filename):
+    """
+    reads the (run,lumi,event) of every entry in the Events tree of a file
+    only the EventAuxiliary branch is enabled so this is much faster than 
+    going through a FWLite Events object 
+    """
+    evt_ids = []
+    root_file = ROOT.TFile.Open(filename,"READ")
+    if not root_file or root_file.IsZombie():
+        raise IOError("file {} could not be opened".format(filename))
+    tree = root_file.Get("Events")
+    if tree:
+        tree.SetBranchStatus("*",0)
+        tree.SetBranchStatus("EventAuxiliary*",1)
+        for entrynr in range(0,tree.GetEntries()):
+            tree.GetEntry(entrynr)
+            aux = tree.EventAuxiliary
+            evt_ids.append([aux.run(),aux.luminosityBlock(),aux.event()])
+    root_file.Close()
+    return evt_ids
+
+class EvtIndex:
+    """
+    an on disk index of (run,lumi,event) -> (file,entry) for a set of EDM files
+
+    the per file event ids are cached in a json in the cache dir (see 
+    CoreTools.get_cache_dir()) keyed by the file set and are only re-read if 
+    the file mtime or size has changed, lookups are then a binary search
+
+    get_index() returns the index to pass to Events.to() assuming the Events
+    object was made from the same list of files in the same order
+    """
+    def __init__(self,filenames,cache_filename=None,verbose=False):
+        self.filenames = [str(x) for x in filenames]
+        self.verbose = verbose
+        if cache_filename:
+            self.cache_filename = cache_filename
+        else:
+            fileset_hash = hashlib.sha1("\n".join(self.filenames).encode("utf-8")).hexdigest()
+            self.cache_filename = os.path.join(CoreTools.get_cache_dir(),"evtindex_{}.json".format(fileset_hash))
+        self.file_data = {}
+        self._load_cache()
+        if self._update():
+            self._save_cache()
+        self._build_lut()
+
+    def _load_cache(self):
+        if os.path.exists(self.cache_filename):
+            try:
+                with open(self.cache_filename) as f:
+                    self.file_data = json.load(f)
+            except ValueError:
+                print("EvtIndex: cache {} is corrupted, rebuilding".format(self.cache_filename))
+                self.file_data = {}
+    
+    def _save_cache(self):
+        tmp_filename = "{}.{}.tmp".format(self.cache_filename,os.getpid())
+        with open(tmp_filename,"w") as f:
+            json.dump(self.file_data,f)
+        os.rename(tmp_filename,self.cache_filename)
+    
+    def _update(self):
+        """
+        re-reads the event ids of any file which is new or modified
+        returns True if anything was updated
+        """
+        updated = False
+        for filename in self.filenames:
+            mtime,size = CoreTools.get_file_stats(filename)
+            data = self.file_data.get(filename)
+            if data and data['mtime']==mtime and data['size']==size:
+                continue
+            if self.verbose:
+                print("EvtIndex: indexing {}".format(filename))
+            self.file_data[filename] = {'mtime' : mtime,'size' : size,
+                                        'evt_ids' : read_evt_ids(filename)}
+            updated = True
+        return updated
+
+    def _build_lut(self):
+        entries = []
+        global_offset = 0
+        for filenr,filename in enumerate(self.filenames):
+            evt_ids = self.file_data[filename]['evt_ids']
+            for entrynr,evt_id in enumerate(evt_ids):
+                entries.append((tuple(evt_id),filenr,entrynr,global_offset+entrynr))
+            global_offset += len(evt_ids)
+        #sorting is stable so for duplicated events the first file wins
+        entries.sort(key=lambda x : x[0])
+        self.keys = [x[0] for x in entries]
+        self.locations = [x[1:] for x in entries]
+        self.nr_events = global_offset
+
+    def _find(self,run,lumi,event):
+        key = (int(run),int(lumi),int(event))
+        pos = bisect.bisect_left(self.keys,key)
+        if pos < len(self.keys) and self.keys[pos]==key:
+            return self.locations[pos]
+        return None
+    
+    def get_file_entry(self,run,lumi,event):
+        """returns the (filename,entry) of the event or None if not found"""
+        location = self._find(run,lumi,event)
+        if location:
+            return self.filenames[location[0]],location[1]
+        return None
+
+    def get_index(self,run,lumi,event):
+        """returns the global index of the event for Events.to() or None if not found"""
+        location = self._find(run,lumi,event)
+        return location[2] if location else None
+
+    def to(self,events,run,lumi,event):
+        """
+        moves the events to the given event, returns False if it is not found
+        """
+        index = self.get_index(run,lumi,event)
+        if index is None:
+            return False
+        events.to(index)
+        return True
+
+    def __contains__(self,evt_id):
+        return self._find(*evt_id) is not None
+
+def to_event(events,index,evt_index=None):
+    """
+    moves the events to index, if an EvtIndex is given index is instead the 
+    (run,lumi,event) of the event
+    returns False (after printing a message) if the event is not found
+    """
+    if evt_index is None:
+        events.to(index)
+        return True
+    if not evt_index.to(events,*index):
+        print("event {} {} {} not found".format(*index))
+        return False
+    return True
@@ -0,0 +1,137 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ROOT
+import time
+from DataFormats.FWLite import Events
+
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+from Analysis.HLTAnalyserPy.EvtData import EvtData
+
+"""
+an event loop which runs several consumers (trees, histogram collections etc)
+in a single pass over the events so each event is only read and its products
+only deserialised once, however many outputs are being made
+
+all consumers share one EvtData whose products are the union of the products
+of each consumer
+"""
+
+class Consumer:
+    """
+    something run by the EvtLoop which writes to its own output file
+       name = name for printouts
+       out_filename = the output root file, None if the consumer writes its own output,
+                      consumers run by the EvtLoop with the same out_filename share the file
+       make_func = a function taking the EvtData returning the object to fill
+                   (eg an EgHLTTree), it is called with the output file as the
+                   current directory so any TTrees/histograms are made in it
+       fill_func = a function taking the object and the EvtData to fill it for the event,
+                   defaults to calling obj.fill()
+       products = the products needed by the consumer
+       evt_filter = a callable taking the EvtData, the event is only filled if it returns True (eg an EvtPreFilter)
+       end_func = a function taking the object called at the end before the output file is written
+    """
+    def __init__(self,name,out_filename,make_func,fill_func=None,products=[],evt_filter=None,end_func=None):
+        self.name = name
+        self.out_filename = out_filename
+        self.make_func = make_func
+        self.fill_func = fill_func
+        self.products = list(products)
+        self.evt_filter = evt_filter
+        self.end_func = end_func
+        self.out_file = None
+        self.owns_out_file = False
+        self.obj = None
+        self.nr_filled = 0
+
+    def begin(self,evtdata,out_file=None):
+        """
+        makes the object to fill, if out_file is given it is used as the output
+        file and it is up to the caller to write and close it
+        """
+        if out_file is not None:
+            self.out_file = out_file
+            self.out_file.cd()
+        elif self.out_filename:
+            self.out_file = ROOT.TFile(self.out_filename,"RECREATE")
+            self.owns_out_file = True
+        self.obj = self.make_func(evtdata)
+        ROOT.gROOT.cd()
+
+    def fill(self,evtdata):
+        if self.evt_filter and not self.evt_filter(evtdata):
+            return
+        if self.fill_func:
+            self.fill_func(self.obj,evtdata)
+        else:
+            self.obj.fill()
+        self.nr_filled += 1
+
+    def end(self):
+        if self.end_func:
+            self.end_func(self.obj)
+        if self.out_file and self.owns_out_file:
+            self.out_file.cd()
+            self.out_file.Write()
+            self.out_file.Close()
+            ROOT.gROOT.cd()
+
+def merge_products(product_lists):
+    """
+    combines lists of products removing duplicates, a product name used with
+    a different type or tag is an error as the consumers would disagree on what
+    it is
+    """
+    merged = []
+    by_name = {}
+    for products in product_lists:
+        for product in products:
+            existing = by_name.get(product['name'])
+            if existing is None:
+                by_name[product['name']] = product
+                merged.append(product)
+            elif existing['type']!=product['type'] or existing['tag']!=product['tag']:
+                raise ValueError("product {} is defined as both {} {} and {} {}".format(product['name'],existing['type'],existing['tag'],product['type'],product['tag']))
+    return merged
+
+class EvtLoop:
+    """
+    runs the consumers over the events in a single pass
+       consumers = list of Consumer
+       products = any additional products, eg for filters
+    the EvtData is made at construction and is availible as .evtdata so
+    profiling or learned prefetch can be enabled before running
+    """
+    def __init__(self,consumers,products=[],verbose=False):
+        self.consumers = list(consumers)
+        self.evtdata = EvtData(merge_products([products]+[c.products for c in self.consumers]),verbose=verbose)
+
+    def run(self,in_filenames,prefix="",maxevents=-1,report=10000,entry_range=None):
+        out_files = {}
+        for consumer in self.consumers:
+            if consumer.out_filename and consumer.out_filename not in out_files:
+                out_files[consumer.out_filename] = ROOT.TFile(consumer.out_filename,"RECREATE")
+            consumer.begin(self.evtdata,out_files.get(consumer.out_filename))
+
+        events = Events(CoreTools.get_filenames(in_filenames,prefix),maxEvents=maxevents)
+        nr_events = events.size()
+        start_time = time.time()
+        for event_nr,event in enumerate(CoreTools.iter_events(events,entry_range)):
+            if report>0 and event_nr%report==0:
+                print("processing event {} / {} time {:.1f}s".format(event_nr,nr_events,time.time()-start_time))
+            self.evtdata.get_handles(event)
+            for consumer in self.consumers:
+                consumer.fill(self.evtdata)
+
+        for consumer in self.consumers:
+            consumer.end()
+        for out_file in out_files.values():
+            out_file.cd()
+            out_file.Write()
+            out_file.Close()
+        ROOT.gROOT.cd()
+
+    def get_report(self):
+        return "\n".join("{} : filled {} events{}".format(c.name,c.nr_filled," -> "+c.out_filename if c.out_filename else "") for c in self.consumers)
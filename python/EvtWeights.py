@@ -59,10 +59,37 @@ class PtBinnedSample:
                                self.nr_em*self.em_mu_filt_eff + 
                                self.nr_mu*self.mu_em_filt_eff)
 
+def get_intime_pu_sum(evtdata):
+    return [x for x in evtdata.get("pu_sum") if x.getBunchCrossing()==0][0]
+
+def vec_to_array(vec,dtype=numpy.float32):
+    """
+    copies a std::vector to a numpy array through its buffer rather than
+    looping over it in python, falls back to iterating if there is no buffer
+    """
+    size = vec.size()
+    if size==0:
+        return numpy.zeros(0,dtype=dtype)
+    try:
+        return numpy.frombuffer(vec.data(),dtype=dtype,count=size).copy()
+    except (AttributeError,TypeError,ValueError):
+        return numpy.fromiter(vec,dtype=dtype,count=size)
+
+def get_pu_pt_hats(evtdata):
+    """
+    the pt hats of the in time pileup interactions as a numpy array
+    """
+    return vec_to_array(get_intime_pu_sum(evtdata).getPU_pT_hats())
+
 class QCDWeightCalc:
     """ 
     translation of Christian Veelken's mcStiching
     https://github.com/veelken/mcStitching
+
+    the weights can be computed for a batch of events at once with weights()
+    and enriched_weights() which bin all the pt hats in one go, weight() and 
+    enriched_weight() do a single event and cache the result in the event so 
+    asking for them again (eg EvtWeights.weight then filtweight) is free
     """
     def __init__(self,ptbinned_samples,bx_freq=30000000.0):
         self.bx_freq = bx_freq
@@ -79,61 +106,89 @@ class QCDWeightCalc:
         for bin_ in self.bins[1:]:
             bin_.set_enriched_counts(min_bias.nr_inclusive,min_bias.xsec)
 
-    def weight(self,evtdata,disable_enriched=False):
-        pusum_intime = [x for x in evtdata.get("pu_sum") if x.getBunchCrossing()==0]
-        bin_counts = [0]*(len(self.bins)+1)
-        tot_count= pusum_intime[0].getPU_pT_hats().size()
-        for pu_pt_hat in pusum_intime[0].getPU_pT_hats():
-            bin_nr = numpy.searchsorted(self.bin_lowedges,pu_pt_hat,'right')
-            #overflow means we fill bin 1 which is the inclusive min bias bin
-            try:
-                bin_counts[bin_nr]+=1
-            except IndexError:
-                bin_counts[1]+=1
-       
-        geninfo = evtdata.get("geninfo")
-        tot_count +=1
-        #again like for PU, overflow means we fill bin 1 which is the inclusive min bias bin
-        try:            
-            bin_counts[numpy.searchsorted(self.bin_lowedges,geninfo.qScale(),'right')]+=1
-        except IndexError:
-            bin_counts[1]+=1
+        #the expected number of mc events is 
+        #  sum over bins of nr_inclusive * bin_frac / theory_frac
+        #where theory_frac = xsec / min_bias_xsec and bin 0, the inclusively
+        #generated min bias sample, is not corrected so we precompute
+        #the per bin factor multiplying bin_frac and the constant bin 0 term
+        self.bin_edges = numpy.array(self.bin_lowedges,dtype=numpy.float64)
+        self.nr_mb_expect = float(min_bias.nr_inclusive)
+        self.frac_to_nr_expect = numpy.array([0.]+[float(x.nr_inclusive)*float(min_bias.xsec)/float(x.xsec) for x in self.bins[1:]])
+
+        div_with_check = lambda a,b :  a/b if b!=0 else 1.
+        self.emmu_weights = numpy.array([div_with_check(x.nr_emmu_expect,x.nr_emmu_actual) for x in self.bins])
+        self.emnomu_weights = numpy.array([div_with_check(x.nr_emnomu_expect,x.nr_emnomu_actual) for x in self.bins])
+        self.munoem_weights = numpy.array([div_with_check(x.nr_munoem_expect,x.nr_munoem_actual) for x in self.bins])
+
+    def weights(self,pu_pt_hats,gen_pt_hats):
+        """
+        returns an array of the weights (without the enriched correction) of a batch of events
+          pu_pt_hats = the in time pileup pt hats of each event, a 2D array (events x pileup)
+                       or a list of arrays
+          gen_pt_hats = the pt hat (qScale) of the signal interaction of each event
+        all the pt hats are binned with a single searchsorted and counted per
+        event with a single bincount
+        """
+        gen_pt_hats = numpy.asarray(gen_pt_hats,dtype=numpy.float64).reshape(-1)
+        nr_evts = len(gen_pt_hats)
+        if isinstance(pu_pt_hats,numpy.ndarray) and pu_pt_hats.ndim==2:
+            nr_pu = numpy.full(nr_evts,pu_pt_hats.shape[1],dtype=numpy.int64)
+            pu_pt_hats = pu_pt_hats.reshape(-1)
+        else:
+            nr_pu = numpy.array([len(x) for x in pu_pt_hats],dtype=numpy.int64)
+            pu_pt_hats = numpy.concatenate(pu_pt_hats) if nr_evts else numpy.zeros(0)
         
-        min_bias_xsec = self.bins[0].xsec
-
-        expect_events_mc = 0
-        for bin_nr,sample_bin in enumerate(self.bins):
-            bin_frac = float(bin_counts[bin_nr+1])/float(tot_count)
-            theory_frac =  float(sample_bin.xsec) / float(min_bias_xsec)
-            #dont correct inclusively generated sample
-            prob_corr = bin_frac / theory_frac if bin_nr!=0 else 1.
-            expect_events_mc += sample_bin.nr_inclusive * prob_corr
-            
-        weight = float(self.bx_freq) / float(expect_events_mc)
-        if not disable_enriched:
-            weight *= self.enriched_weight(evtdata)
-        return weight
+        pt_hats = numpy.concatenate([pu_pt_hats,gen_pt_hats])
+        evt_nrs = numpy.concatenate([numpy.repeat(numpy.arange(nr_evts),nr_pu),numpy.arange(nr_evts)])
+        bin_nrs = numpy.searchsorted(self.bin_edges,pt_hats,'right')
+        #overflow means we fill bin 1 which is the inclusive min bias bin
+        nr_bin_nrs = len(self.bins)+1
+        bin_nrs[bin_nrs>=nr_bin_nrs] = 1
+        bin_counts = numpy.bincount(evt_nrs*nr_bin_nrs+bin_nrs,minlength=nr_evts*nr_bin_nrs).reshape(nr_evts,nr_bin_nrs)
 
-    def enriched_weight(self,evtdata):
+        tot_counts = (nr_pu+1).astype(numpy.float64)
+        expect_events_mc = self.nr_mb_expect + bin_counts[:,1:].dot(self.frac_to_nr_expect)/tot_counts
+        return float(self.bx_freq) / expect_events_mc
+
+    def enriched_weights(self,gen_pt_hats,pass_em,pass_mu):
+        """
+        returns an array of the enriched sample corrections of a batch of events
+        given their pt hats and whether they passed the em and mu enriching filters
+        """
+        gen_pt_hats = numpy.asarray(gen_pt_hats,dtype=numpy.float64).reshape(-1)
+        pass_em = numpy.asarray(pass_em,dtype=bool).reshape(-1)
+        pass_mu = numpy.asarray(pass_mu,dtype=bool).reshape(-1)
+        #should never be -1 as we should never hit the underflow 
+        #and if so there is a problem
+        sample_nrs = numpy.searchsorted(self.bin_edges,gen_pt_hats,'right')-1
+        sample_nrs[sample_nrs>=len(self.bins)] = 0
+        weights = numpy.ones(len(gen_pt_hats))
+        weights = numpy.where(pass_em & pass_mu,self.emmu_weights[sample_nrs],weights)
+        weights = numpy.where(pass_em & ~pass_mu,self.emnomu_weights[sample_nrs],weights)
+        weights = numpy.where(~pass_em & pass_mu,self.munoem_weights[sample_nrs],weights)
+        return weights
+
+    def _make_weight(self,evtdata):
+        gen_pt_hat = evtdata.get("geninfo").qScale()
+        return float(self.weights([get_pu_pt_hats(evtdata)],[gen_pt_hat])[0])
+
+    def _make_enriched_weight(self,evtdata):
         self.gen_filters.fill(evtdata)
         pass_em = self.gen_filters.result("Gen_QCDEmEnrichingNoBCToEFilter")
         pass_mu = self.gen_filters.result("Gen_QCDMuGenFilter")
-        if  pass_em or pass_mu:
-            geninfo = evtdata.get("geninfo")
-            #should never be -1 as we should never hit the underflow 
-            #and if so there is a problem
-            sample_nr = numpy.searchsorted(self.bin_lowedges,geninfo.qScale(),'right')-1
-            sample_nr = sample_nr if sample_nr < len(self.bins) else 0
-            bin_ = self.bins[sample_nr]    
-            div_with_check = lambda a,b :  a/b if b!=0 else 1.
-            if pass_em and pass_mu:
-                return div_with_check(bin_.nr_emmu_expect,bin_.nr_emmu_actual)
-            elif pass_em and not pass_mu:
-                return div_with_check(bin_.nr_emnomu_expect,bin_.nr_emnomu_actual)
-            elif not pass_em and pass_mu:
-                return div_with_check(bin_.nr_munoem_expect,bin_.nr_munoem_actual)
-        else:
+        if not pass_em and not pass_mu:
             return 1.
+        gen_pt_hat = evtdata.get("geninfo").qScale()
+        return float(self.enriched_weights([gen_pt_hat],[pass_em],[pass_mu])[0])
+
+    def weight(self,evtdata,disable_enriched=False):
+        weight = evtdata.get_derived(("qcd_weight",id(self)),self._make_weight)
+        if not disable_enriched:
+            weight *= self.enriched_weight(evtdata)
+        return weight
+
+    def enriched_weight(self,evtdata):
+        return evtdata.get_derived(("qcd_enriched_weight",id(self)),self._make_enriched_weight)
 
 class EvtWeights:
     
@@ -169,8 +224,7 @@ class EvtWeights:
             if mcsample.proc_type == MCSample.ProcType.WJets: key = "wjets"
             try:
                 if nr_expt_pu==None and get_pu_from_evt:
-                    pusum_intime = [x for x in evtdata.get("pu_sum") if x.getBunchCrossing()==0]
-                    nr_expt_pu = pusum_intime[0].getTrueNumInteractions()
+                    nr_expt_pu = get_intime_pu_sum(evtdata).getTrueNumInteractions()
                     
                 lumi  = self.lumi if nr_expt_pu==None else (self.bx_freq*nr_expt_pu+1)/self.mb_xsec
                 return self.data['v2'][key][0]['xsec']/self.data['v2'][key][0]['nrtot']*lumi
@@ -0,0 +1,159 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ROOT
+import hashlib
+import json
+import multiprocessing
+import os
+
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+
+"""
+per file metadata (readable, number of events, size, mtime, header checksum
+and optionally Runs tree counters) checked in parallel and cached on disk
+
+the cache is a json in the cache dir (see CoreTools.get_cache_dir()) keyed by
+filename, a file is only re-checked if its mtime or size have changed, a
+counter is requested which was not read before or it was not readable last
+time, so checking the same thousands of files again is just reading the cache
+
+the event counts are used by ParallelRunner to split jobs
+"""
+
+_cache_name = "filemetadata.json"
+
+#number of bytes at the start of the file used for the header checksum
+header_size = 65536
+
+def get_header_checksum(filename):
+    """
+    sha1 of the start of the file (which contains the root file header),
+    None for remote files
+    """
+    local_filename = CoreTools.get_local_filename(filename)
+    if not local_filename or not os.path.exists(local_filename):
+        return None
+    with open(local_filename,"rb") as f:
+        return hashlib.sha1(f.read(header_size)).hexdigest()
+
+def get_runs_counter_name(proc_name="HLTX"):
+    """
+    the branch of the Runs tree with the number of events input to the hlt process
+    """
+    return "edmMergeableCounter_hltNrInputEvents_nrEventsRun_{proc_name}".format(proc_name=proc_name)
+
+def read_runs_counters(root_file,counter_names):
+    """
+    sums the given edm::MergeableCounter branches over the entries of the Runs
+    tree, only those branches are read
+    returns a dict of name : value, None if the branch does not exist
+    """
+    counters = {name : None for name in counter_names}
+    runs = root_file.Get("Runs")
+    if not runs or not counter_names:
+        return counters
+    runs.SetBranchStatus("*",0)
+    names_to_read = []
+    for name in counter_names:
+        if runs.GetBranch(name):
+            runs.SetBranchStatus(name+"*",1)
+            names_to_read.append(name)
+            counters[name] = 0
+    for entrynr in range(0,runs.GetEntries()):
+        runs.GetEntry(entrynr)
+        for name in names_to_read:
+            counters[name] += getattr(runs,name).value
+    return counters
+
+def check_file(filename,counter_names=()):
+    """
+    opens the file and returns its metadata, the file is readable if it can be
+    opened, was not recovered and has an Events tree
+    """
+    mtime,size = CoreTools.get_file_stats(filename)
+    meta = {'mtime' : mtime,'size' : size,'readable' : False,'nr_events' : None,
+            'header_checksum' : None,'counters' : {}}
+    root_file = ROOT.TFile.Open(filename,"READ")
+    if not root_file or root_file.IsZombie() or root_file.TestBit(ROOT.TFile.kRecovered):
+        return meta
+    events = root_file.Get("Events")
+    if events:
+        meta['readable'] = True
+        meta['nr_events'] = int(events.GetEntries())
+        meta['counters'] = read_runs_counters(root_file,counter_names)
+    root_file.Close()
+    meta['header_checksum'] = get_header_checksum(filename)
+    return meta
+
+def _check_file(filename_and_counters):
+    filename,counter_names = filename_and_counters
+    try:
+        return filename,check_file(filename,counter_names)
+    except Exception as err:
+        print("FileMetadata: error checking {} : {}".format(filename,err))
+        mtime,size = CoreTools.get_file_stats(filename)
+        return filename,{'mtime' : mtime,'size' : size,'readable' : False,'nr_events' : None,
+                         'header_checksum' : None,'counters' : {}}
+
+def _load_cache(cache_filename):
+    if os.path.exists(cache_filename):
+        try:
+            with open(cache_filename) as f:
+                return json.load(f)
+        except ValueError:
+            print("FileMetadata: cache {} is corrupted, rebuilding".format(cache_filename))
+    return {}
+
+def _save_cache(cache_filename,cache):
+    tmp_filename = "{}.{}.tmp".format(cache_filename,os.getpid())
+    with open(tmp_filename,"w") as f:
+        json.dump(cache,f)
+    os.rename(tmp_filename,cache_filename)
+
+def _is_valid(meta,mtime,size,counter_names):
+    #unreadable files are always re-checked as the failure may be temporary
+    #(eg an xrootd error) and remote files have no mtime or size to tell us
+    if not meta or not meta['readable'] or meta['mtime']!=mtime or meta['size']!=size:
+        return False
+    return all(name in meta['counters'] for name in counter_names)
+
+def get_file_metadata(filenames,counter_names=(),nr_procs=8,cache_filename=None,verbose=False):
+    """
+    returns a dict of filename : metadata for the files, files which are new,
+    modified, unreadable last time or missing a requested counter are checked 
+    in nr_procs processes
+    the metadata is a dict with keys
+        readable, nr_events, size, mtime, header_checksum, counters (name : value)
+    """
+    if cache_filename is None:
+        cache_filename = os.path.join(CoreTools.get_cache_dir(),_cache_name)
+    counter_names = list(counter_names)
+    cache = _load_cache(cache_filename)
+
+    to_check = []
+    for filename in filenames:
+        mtime,size = CoreTools.get_file_stats(filename)
+        if not _is_valid(cache.get(filename),mtime,size,counter_names):
+            cached_counters = cache.get(filename,{}).get('counters',{})
+            to_check.append((filename,sorted(set(counter_names)|set(cached_counters))))
+
+    if to_check:
+        if verbose:
+            print("FileMetadata: checking {} of {} files".format(len(to_check),len(filenames)))
+        if nr_procs>1 and len(to_check)>1:
+            pool = multiprocessing.Pool(min(nr_procs,len(to_check)))
+            try:
+                results = pool.map(_check_file,to_check,chunksize=max(1,len(to_check)//(nr_procs*4)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_check_file(x) for x in to_check]
+        #another job may have updated the cache in the mean time
+        cache = _load_cache(cache_filename)
+        cache.update(dict(results))
+        _save_cache(cache_filename,cache)
+
+    return {filename : cache[filename] for filename in filenames}
@@ -130,6 +130,17 @@ class MCSample:
     def __str__(self):
         return "ProcType {s.proc_type} FiltType {s.filt_type}  min pthat {s.min_pthat} max pthat {s.max_pthat}".format(s=self)
 
+    def to_dict(self):
+        """json serialisable form so the sample type of a file can be cached"""
+        return {"proc_type" : int(self.proc_type),"filt_type" : int(self.filt_type),
+                "min_pthat" : self.min_pthat,"max_pthat" : self.max_pthat,
+                "com_energy" : self.com_energy}
+
+    @staticmethod
+    def from_dict(data):
+        return MCSample(MCSample.ProcType(data["proc_type"]),MCSample.FiltType(data["filt_type"]),
+                        data["min_pthat"],data["max_pthat"],data["com_energy"])
+
         
 class MCSampleGetter:
     def __init__(self):
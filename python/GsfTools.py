@@ -5,7 +5,15 @@ from __future__ import print_function
 import ROOT
 import re
 
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+
 def get_indx_best_gsf(egobj):
+    """
+    the index of the best gsf track, computed once per object per event
+    """
+    return CoreTools.memoise(egobj,"indx_best_gsf",_calc_indx_best_gsf)
+
+def _calc_indx_best_gsf(egobj):
     min_epm1=999.9
     min_mhit=999
     index_best_gsf=0
@@ -5,13 +5,47 @@ from __future__ import print_function
 import ROOT
 import sys
 import re
+import math
+import numpy
+from functools import partial
 
 import Analysis.HLTAnalyserPy.GsfTools as GsfTools
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
+from Analysis.HLTAnalyserPy.MatchTools import EtaPhiGrid, delta_phi
+import Analysis.HLTAnalyserPy.CollArrays as CollArrays
 
 # Redefined isolation variables for phase-2, 
 # more details in 
 # https://indico.cern.ch/event/962025/contributions/4088172/attachments/2135799/3597622/HLT%20Workshop%2003_11_2020.pdf
 
+def get_coll_grid(evtdata,coll_name,obj_func=None):
+    """
+    returns an EtaPhiGrid of the collection so the isolation sums only need to
+    loop over the objects near the e/gamma object, it is made once per event
+    obj_func, if given, converts each object in the collection to the object 
+    with the eta/phi (eg the TTTrack of the l1trks)
+    collections with a CollArrays snapshot take the eta/phi from that instead
+    """
+    def make_grid(evtdata):
+        if coll_name in CollArrays.coll_fields:
+            arrs = CollArrays.get_coll_arrays(evtdata,coll_name)
+            return EtaPhiGrid(arrs['eta'],arrs['phi'])
+        coll = evtdata.get(coll_name)
+        if obj_func:
+            coll = [obj_func(obj) for obj in coll]
+        return EtaPhiGrid.from_coll(coll)
+    return evtdata.get_derived(("eta_phi_grid",coll_name),make_grid)
+
+def _calc_sc_seed_ids(egobj):
+    return frozenset(c.seed().rawId() for c in egobj.superCluster().clusters())
+
+def get_sc_seed_ids(egobj):
+    """
+    the seed ids of the clusters of the supercluster, computed once per object per event
+    """
+    return CoreTools.memoise(egobj,"sc_seed_ids",_calc_sc_seed_ids)
+
 def get_hlt_iso(egobj,evtdata,trkcoll="trksv6",min_pt=1.,max_dz=0.15,min_deta=0.01,max_dr2=0.3*0.3,min_dr2=0.01*0.01):
 
     if egobj.gsfTracks().empty():
@@ -26,7 +60,9 @@ def get_hlt_iso(egobj,evtdata,trkcoll="trksv6",min_pt=1.,max_dz=0.15,min_deta=0.
     isol = 0.
 
     trks = evtdata.get(trkcoll)
-    for trk in trks:
+    grid = get_coll_grid(evtdata,trkcoll)
+    for trknr in grid.candidates(eta,phi,math.sqrt(max_dr2)):
+        trk = trks[int(trknr)]
         if trk.pt()<min_pt: continue
         dz = vz - trk.vz()
         if abs(dz)>max_dz: continue
@@ -52,8 +88,9 @@ def get_l1_iso(egobj,evtdata,min_pt=2.,max_dz=0.7,min_deta=0.003,max_dr2=0.3*0.3
     l1isol = 0.
 
     l1trks = evtdata.get("l1trks")
-    for l1trk_extra in l1trks:
-        l1trk = l1trk_extra.ttTrk()
+    grid = get_coll_grid(evtdata,"l1trks",lambda x : x.ttTrk())
+    for l1trknr in grid.candidates(eta,phi,math.sqrt(max_dr2)):
+        l1trk = l1trks[int(l1trknr)].ttTrk()
         pt = l1trk.momentum().perp()
         if pt <min_pt: continue
         dz = vz - l1trk.z0()
@@ -71,13 +108,15 @@ def get_hgcal_iso(egobj,evtdata,min_pt=2.0,min_deta=0.0,max_dr2=0.2*0.2,min_dr2=
     hgcal_isol=0
     ele_eta = egobj.superCluster().eta()
     ele_phi = egobj.superCluster().phi()
-    for clus in evtdata.get("hgpfclus"):
+    clusters = evtdata.get("hgpfclus")
+    grid = get_coll_grid(evtdata,"hgpfclus")
+    for clusnr in grid.candidates(ele_eta,ele_phi,math.sqrt(max_dr2)):
+        clus = clusters[int(clusnr)]
         if clus.pt()<min_pt: continue
         if abs(clus.eta()-ele_eta)<min_deta: continue
         dr2 = ROOT.reco.deltaR2(ele_eta,ele_phi,clus.eta(),clus.phi())
         if dr2>max_dr2 or dr2<min_dr2: continue
-        sc_seed_ids = [c.seed().rawId() for c in egobj.superCluster().clusters()]
-        if clus.seed().rawId() not in sc_seed_ids:
+        if clus.seed().rawId() not in get_sc_seed_ids(egobj):
                 hgcal_isol+=clus.pt()
     return hgcal_isol
 
@@ -94,13 +133,15 @@ def get_ecal_iso(egobj,evtdata,min_pt=0.0,min_deta=0.0,max_dr2=0.2*0.2,min_dr2=0
     ecal_isol=0
     ele_eta = egobj.superCluster().eta()
     ele_phi = egobj.superCluster().phi()
-    for clus in evtdata.get("ecalpfclus"):
+    clusters = evtdata.get("ecalpfclus")
+    grid = get_coll_grid(evtdata,"ecalpfclus")
+    for clusnr in grid.candidates(ele_eta,ele_phi,math.sqrt(max_dr2)):
+        clus = clusters[int(clusnr)]
         if clus.pt()<min_pt: continue
         if abs(clus.eta()-ele_eta)<min_deta: continue
         dr2 = ROOT.reco.deltaR2(ele_eta,ele_phi,clus.eta(),clus.phi())
         if dr2>max_dr2 or dr2<min_dr2: continue
-        sc_seed_ids = [c.seed().rawId() for c in egobj.superCluster().clusters()]
-        if clus.seed().rawId() not in sc_seed_ids:
+        if clus.seed().rawId() not in get_sc_seed_ids(egobj):
                 ecal_isol+=clus.pt()
     return ecal_isol
 
@@ -109,7 +150,10 @@ def get_hcal_iso(egobj,evtdata,min_pt=2.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0
     hcal_isol=0
     ele_eta = egobj.superCluster().eta()
     ele_phi = egobj.superCluster().phi()
-    for clus in evtdata.get("hcalpfclus"):
+    clusters = evtdata.get("hcalpfclus")
+    grid = get_coll_grid(evtdata,"hcalpfclus")
+    for clusnr in grid.candidates(ele_eta,ele_phi,math.sqrt(max_dr2)):
+        clus = clusters[int(clusnr)]
         if clus.pt()<min_pt: continue
         if abs(clus.eta()-ele_eta)<min_deta: continue
         dr2 = ROOT.reco.deltaR2(ele_eta,ele_phi,clus.eta(),clus.phi())
@@ -118,6 +162,122 @@ def get_hcal_iso(egobj,evtdata,min_pt=2.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0
     return hcal_isol
 
 
+def _delta_r2(eta,phi,etas,phis):
+    """same as reco::deltaR2(eta,phi,etas[i],phis[i]) for each entry"""
+    deta = eta - etas
+    dphi = delta_phi(phi,phis)
+    return deta*deta + dphi*dphi
+
+def _sum_in_order(vals):
+    """
+    sums the values one after another in order as a python loop does so the 
+    result is identical to it, numpy.sum uses pairwise summation which is not
+    """
+    return float(numpy.cumsum(vals)[-1]) if len(vals) else 0.
+
+class IsolEngine:
+    """
+    base class to compute an isolation for several parameter sets (cone sizes, 
+    cuts etc) in a single loop over the collection per e/gamma object rather
+    than one loop per parameter set
+
+    each parameter set is added with add_params which returns a unary function
+    of the e/gamma object giving the isolation for that parameter set suitable 
+    for EgHLTTree.add_eg_vars, the isolations for all the parameter sets are 
+    computed on the first call for an object and cached for the rest of the event
+
+    the collections are read as per event numpy arrays (see CollArrays) so
+    all the parameter sets are evaluated as vectorised expressions over the
+    objects near the e/gamma object, the results are identical to the 
+    corresponding single isolation functions
+    """
+    def __init__(self,evtdata,coll_name):
+        self.evtdata = evtdata
+        self.coll_name = coll_name
+        self.param_sets = []
+
+    def add_params(self,**params):
+        """
+        adds a parameter set, any parameter not given takes its default value
+        """
+        param_set = dict(self.default_params)
+        for key,val in params.items():
+            if key not in param_set:
+                raise ValueError("parameter {} not known, valid parameters are {}".format(key,list(param_set.keys())))
+            param_set[key] = val
+        self.param_sets.append(param_set)
+        return UnaryFunc(partial(get_engine_isol,self,len(self.param_sets)-1))
+
+    def get_isol(self,egobj,param_nr):
+        return CoreTools.memoise(egobj,("isol_engine",id(self)),self.compute)[param_nr]
+
+    def max_dr(self):
+        return math.sqrt(max(params['max_dr2'] for params in self.param_sets))
+
+def get_engine_isol(egobj,engine,param_nr):
+    return engine.get_isol(egobj,param_nr)
+
+class TrkIsolEngine(IsolEngine):
+    """
+    multi parameter version of get_hlt_iso
+    """
+    default_params = {'min_pt' : 1.,'max_dz' : 0.15,'min_deta' : 0.01,'max_dr2' : 0.3*0.3,'min_dr2' : 0.01*0.01}
+
+    def __init__(self,evtdata,trkcoll="trksv6"):
+        IsolEngine.__init__(self,evtdata,trkcoll)
+
+    def compute(self,egobj):
+        if egobj.gsfTracks().empty():
+            return [99.]*len(self.param_sets)
+
+        indx_bestgsf = GsfTools.get_indx_best_gsf(egobj)
+        eta = egobj.gsfTracks()[indx_bestgsf].eta()
+        phi = egobj.gsfTracks()[indx_bestgsf].phi()
+        vz = egobj.gsfTracks()[indx_bestgsf].vz() 
+
+        grid = get_coll_grid(self.evtdata,self.coll_name)
+        trks = CollArrays.get_coll_arrays(self.evtdata,self.coll_name)[grid.candidates(eta,phi,self.max_dr())]
+        pts = trks['pt']
+        abs_dz = numpy.abs(vz - trks['vz'])
+        abs_deta = numpy.abs(eta - trks['eta'])
+        dr2 = _delta_r2(eta,phi,trks['eta'],trks['phi'])
+        isols = []
+        for params in self.param_sets:
+            fail = (pts<params['min_pt']) | (abs_dz>params['max_dz']) | (abs_deta<params['min_deta'])
+            fail |= (dr2 > params['max_dr2']) | (dr2 < params['min_dr2'])
+            isols.append(_sum_in_order(pts[~fail]))
+        return isols
+
+class ClusIsolEngine(IsolEngine):
+    """
+    multi parameter version of get_ecal_iso, get_hcal_iso and get_hgcal_iso
+    veto_sc_clus = removes clusters which are part of the supercluster (ecal and hgcal)
+    """
+    default_params = {'min_pt' : 0.,'min_deta' : 0.,'max_dr2' : 0.2*0.2,'min_dr2' : 0.}
+
+    def __init__(self,evtdata,clus_coll,veto_sc_clus=True):
+        IsolEngine.__init__(self,evtdata,clus_coll)
+        self.veto_sc_clus = veto_sc_clus
+
+    def compute(self,egobj):
+        ele_eta = egobj.superCluster().eta()
+        ele_phi = egobj.superCluster().phi()
+        grid = get_coll_grid(self.evtdata,self.coll_name)
+        clusters = CollArrays.get_coll_arrays(self.evtdata,self.coll_name)[grid.candidates(ele_eta,ele_phi,self.max_dr())]
+        pts = clusters['pt']
+        abs_deta = numpy.abs(clusters['eta'] - ele_eta)
+        dr2 = _delta_r2(ele_eta,ele_phi,clusters['eta'],clusters['phi'])
+        if self.veto_sc_clus and len(clusters):
+            in_sc = numpy.isin(clusters['seed_id'],list(get_sc_seed_ids(egobj)))
+        else:
+            in_sc = numpy.zeros(len(clusters),dtype=bool)
+        isols = []
+        for params in self.param_sets:
+            fail = (pts<params['min_pt']) | (abs_deta<params['min_deta'])
+            fail |= (dr2>params['max_dr2']) | (dr2<params['min_dr2']) | in_sc
+            isols.append(_sum_in_order(pts[~fail]))
+        return isols
+
 # hcal depth vars, for H/E
 # this is not strictly isolation, but still adding in IsolTools, if needed can move to separate file later
 def get_hcalen_depth(egobj,evtdata,depth=1):
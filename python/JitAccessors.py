@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ROOT
+import hashlib
+import json
+import numpy
+
+from Analysis.HLTAnalyserPy.CoreTools import UnaryStrFunc
+
+"""
+an optional backend which evaluates a set of UnaryFunc style string expressions
+(eg "superCluster().seed().seed().rawId()" or 'var("hltEgammaGsfTrackVars_Chi2",0)')
+for a whole collection in a single call to a JIT compiled c++ function
+rather than crossing the python/c++ boundary once per expression per object
+"""
+
+_jit_helpers_declared = False
+
+def _declare_helpers():
+    """
+    the expressions are written as they are in python where refs and pointers 
+    are automatically dereferenced, in c++ we need to do this explicitly 
+    so we wrap every intermediate result in deref()
+    """
+    global _jit_helpers_declared
+    if _jit_helpers_declared:
+        return
+    ROOT.gInterpreter.Declare("""
+#include <vector>
+#include "DataFormats/Common/interface/Ref.h"
+#include "DataFormats/Common/interface/Ptr.h"
+namespace hltanalyserpy_jit {
+  template<typename T> const T& deref(const T& val){return val;}
+  template<typename T> const T& deref(const T* val){return *val;}
+  template<typename C,typename T,typename F> const T& deref(const edm::Ref<C,T,F>& val){return *val;}
+  template<typename T> const T& deref(const edm::Ptr<T>& val){return *val;}
+}
+""")
+    _jit_helpers_declared = True
+
+def _arg_to_cpp(arg):
+    if isinstance(arg,str):
+        return json.dumps(arg)
+    else:
+        return repr(arg)
+
+def expr_to_cpp(expr,obj_name="obj"):
+    """
+    converts a python style chained function string into the c++ equivalent 
+    acting on an object called obj_name
+    """
+    cpp_expr = obj_name
+    for func_str in expr.split("."):
+        func = UnaryStrFunc(func_str)
+        if func.iscallable:
+            args = ",".join(_arg_to_cpp(arg) for arg in func.args)
+            cpp_expr = "hltanalyserpy_jit::deref({}).{}({})".format(cpp_expr,func.name,args)
+        else:
+            cpp_expr = "hltanalyserpy_jit::deref({}).{}".format(cpp_expr,func.name)
+    return cpp_expr
+
+class JitAccessor:
+    """
+    compiles the expressions for a given c++ type into a single function which
+    fills a contiguous array of doubles, one column per expression
+
+       cpp_type = c++ type of the objects, eg "trigger::EgammaObject"
+       exprs = list of string expressions as would be passed to UnaryFunc
+       includes = any headers needed for cpp_type not already known to ROOT
+
+    doubles are used so integer values such as detector ids are exact
+    """
+    def __init__(self,cpp_type,exprs,includes=[]):
+        _declare_helpers()
+        self.cpp_type = cpp_type
+        self.exprs = list(exprs)
+        self.expr_indices = {expr : indx for indx,expr in enumerate(self.exprs)}
+        func_hash = hashlib.sha1("{}\n{}".format(cpp_type,"\n".join(self.exprs)).encode("utf-8")).hexdigest()
+        self.func_name = "fill_{}".format(func_hash[:16])
+        if not hasattr(ROOT.hltanalyserpy_jit,self.func_name):
+            ROOT.gInterpreter.Declare(self._make_code(includes))
+        self.func = getattr(ROOT.hltanalyserpy_jit,self.func_name)
+        self.coll_func = getattr(ROOT.hltanalyserpy_jit,self.func_name+"_coll")
+        self.obj_ptrs = ROOT.std.vector("const {}*".format(cpp_type))()
+        self.out = ROOT.std.vector("double")()
+        self.nr_objs = 0
+
+    def _make_code(self,includes):
+        lines = ['#include "{}"'.format(x) for x in includes]
+        lines.append("namespace hltanalyserpy_jit {")
+        lines.append("  void {}(const std::vector<const {}*>& objs,std::vector<double>& out){{".format(self.func_name,self.cpp_type))
+        lines.append("    const size_t nrObjs = objs.size();")
+        lines.append("    out.resize({}*nrObjs);".format(len(self.exprs)))
+        lines.append("    for(size_t objNr=0;objNr<nrObjs;objNr++){")
+        lines.append("      const auto& obj = *objs[objNr];")
+        for exprnr,expr in enumerate(self.exprs):
+            lines.append("      out[{}*nrObjs+objNr] = {};".format(exprnr,expr_to_cpp(expr)))
+        lines.append("    }")
+        lines.append("  }")
+        #the same for a whole collection (anything with size() and operator[])
+        #so it can be filled without touching the individual objects in python
+        lines.append("  template<typename Coll> void {}_coll(const Coll& objs,std::vector<double>& out){{".format(self.func_name))
+        lines.append("    const size_t nrObjs = objs.size();")
+        lines.append("    out.resize({}*nrObjs);".format(len(self.exprs)))
+        lines.append("    for(size_t objNr=0;objNr<nrObjs;objNr++){")
+        lines.append("      const auto& obj = objs[objNr];")
+        for exprnr,expr in enumerate(self.exprs):
+            lines.append("      out[{}*nrObjs+objNr] = {};".format(exprnr,expr_to_cpp(expr)))
+        lines.append("    }")
+        lines.append("  }")
+        lines.append("}")
+        return "\n".join(lines)
+
+    def evaluate(self,objs):
+        """
+        evaluates all expressions for the objects, returns a numpy array of 
+        shape (nr exprs,nr objs) which is only valid until the next call
+        """
+        self.obj_ptrs.clear()
+        for obj in objs:
+            self.obj_ptrs.push_back(obj)
+        self.nr_objs = self.obj_ptrs.size()
+        self.func(self.obj_ptrs,self.out)
+        return self.values()
+
+    def evaluate_coll(self,coll):
+        """
+        as evaluate but takes the collection product itself (eg a std::vector<reco::Track>)
+        and fills it in a single c++ call without any python loop over the objects
+        """
+        self.nr_objs = coll.size()
+        self.coll_func(coll,self.out)
+        return self.values()
+
+    def values(self):
+        if self.nr_objs==0:
+            return numpy.zeros((len(self.exprs),0))
+        return numpy.asarray(self.out).reshape((len(self.exprs),self.nr_objs))
+
+    def column(self,expr):
+        """returns the values of a given expression for the last evaluated objects"""
+        return self.values()[self.expr_indices[expr]]
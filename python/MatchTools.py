@@ -0,0 +1,172 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import numpy
+
+"""
+vectorised delta R matching, the eta/phi of each collection are extracted once
+and then the full dR^2 matrix is computed with numpy rather than calling 
+reco::deltaR2 for every pair in python
+
+the results are identical to looping with CoreTools.get_best_dr_match
+"""
+
+def get_eta_phi(coll):
+    """returns numpy arrays of the eta and phi of the objects in coll"""
+    etas = numpy.fromiter((obj.eta() for obj in coll),dtype=numpy.float64)
+    phis = numpy.fromiter((obj.phi() for obj in coll),dtype=numpy.float64)
+    return etas,phis
+
+def delta_phi(phi1,phi2):
+    """
+    phi1 - phi2 reduced to [-pi,pi] in the same way as reco::deltaPhi
+    """
+    dphi = numpy.asarray(phi1) - numpy.asarray(phi2)
+    return numpy.where(numpy.abs(dphi)<=math.pi,dphi,dphi - numpy.round(dphi/(2*math.pi))*2*math.pi)
+
+def delta_r2_matrix(etas1,phis1,etas2,phis2):
+    """
+    returns the matrix of dR^2 with shape (len(etas1),len(etas2))
+    """
+    deta = numpy.subtract.outer(etas1,etas2)
+    dphi = delta_phi(phis1[:,numpy.newaxis],phis2[numpy.newaxis,:])
+    return deta*deta + dphi*dphi
+
+def get_best_dr_indices(etas1,phis1,etas2,phis2,max_dr,one_to_one=None):
+    """
+    for each entry of the first collection, returns the index of the best 
+    matching entry in the second collection with dR < max_dr or -1 if there is none
+
+    one_to_one can be 
+       None : each entry is matched to its closest entry, entries of the second
+              collection can be used multiple times
+       "greedy" : pairs are assigned in order of increasing dR, skipping entries already used
+       "optimal" : minimises the total dR^2 of the matched pairs, requires scipy
+    """
+    etas1 = numpy.asarray(etas1,dtype=numpy.float64)
+    phis1 = numpy.asarray(phis1,dtype=numpy.float64)
+    etas2 = numpy.asarray(etas2,dtype=numpy.float64)
+    phis2 = numpy.asarray(phis2,dtype=numpy.float64)
+    indices = numpy.full(len(etas1),-1,dtype=numpy.int64)
+    if len(etas1)==0 or len(etas2)==0:
+        return indices
+    
+    max_dr2 = max_dr*max_dr
+    dr2 = delta_r2_matrix(etas1,phis1,etas2,phis2)
+    in_cone = dr2 < max_dr2
+
+    if one_to_one is None:
+        #argmin returns the first minimum as does the strict < in the loop version
+        best = numpy.argmin(dr2,axis=1)
+        has_match = in_cone[numpy.arange(len(etas1)),best]
+        indices[has_match] = best[has_match]
+    elif one_to_one=="greedy":
+        cands1,cands2 = numpy.nonzero(in_cone)
+        order = numpy.argsort(dr2[cands1,cands2],kind="stable")
+        used2 = numpy.zeros(len(etas2),dtype=bool)
+        for indx1,indx2 in zip(cands1[order],cands2[order]):
+            if indices[indx1]==-1 and not used2[indx2]:
+                indices[indx1] = indx2
+                used2[indx2] = True
+    elif one_to_one=="optimal":
+        try:
+            from scipy.optimize import linear_sum_assignment
+        except ImportError:
+            raise ImportError("optimal one to one matching requires scipy")
+        #pairs outside the cone get a cost larger than any valid assignment
+        cost = numpy.where(in_cone,dr2,max_dr2*(len(etas1)+len(etas2)+1))
+        rows,cols = linear_sum_assignment(cost)
+        valid = in_cone[rows,cols]
+        indices[rows[valid]] = cols[valid]
+    else:
+        raise ValueError("one_to_one mode {} not known, must be None, greedy or optimal".format(one_to_one))
+    return indices
+
+def get_best_dr_matches(objs,coll,max_dr,one_to_one=None):
+    """
+    returns a list with the best match in coll (or None) for each object in objs
+    see get_best_dr_indices for the options
+    """
+    coll = list(coll)
+    etas1,phis1 = get_eta_phi(objs)
+    etas2,phis2 = get_eta_phi(coll)
+    indices = get_best_dr_indices(etas1,phis1,etas2,phis2,max_dr,one_to_one)
+    return [coll[indx] if indx>=0 else None for indx in indices]
+
+class EtaPhiGrid:
+    """
+    bins a collection in eta/phi so that cone queries only look at the objects 
+    in the nearby bins rather than the whole collection
+
+    phi is binned over [-pi,pi) and cone queries wrap around, eta is binned 
+    from the minimum to the maximum eta of the collection
+    """
+    #added to the cone size so rounding never loses an object on the cone edge
+    _pad = 1.0E-6
+
+    def __init__(self,etas,phis,cell_size=0.1):
+        self.etas = numpy.asarray(etas,dtype=numpy.float64)
+        self.phis = numpy.asarray(phis,dtype=numpy.float64)
+        self.cell_size = cell_size
+        self.nr_phi_bins = max(1,int(2*math.pi/cell_size))
+        self.phi_width = 2*math.pi/self.nr_phi_bins
+        if len(self.etas):
+            self.eta_min = self.etas.min()
+            self.nr_eta_bins = int((self.etas.max()-self.eta_min)/cell_size)+1
+        else:
+            self.eta_min = 0.
+            self.nr_eta_bins = 1
+        
+        eta_bins = numpy.clip(numpy.floor((self.etas-self.eta_min)/cell_size).astype(numpy.int64),0,self.nr_eta_bins-1)
+        phi_bins = numpy.floor((self.phis+math.pi)/self.phi_width).astype(numpy.int64) % self.nr_phi_bins
+        cell_ids = eta_bins*self.nr_phi_bins + phi_bins
+        #stable so within a cell the objects stay in their original order
+        self.order = numpy.argsort(cell_ids,kind="stable")
+        self.cell_starts = numpy.searchsorted(cell_ids[self.order],numpy.arange(self.nr_eta_bins*self.nr_phi_bins+1))
+
+    @classmethod
+    def from_coll(cls,coll,cell_size=0.1):
+        etas,phis = get_eta_phi(coll)
+        return cls(etas,phis,cell_size)
+
+    def candidates(self,eta,phi,max_dr):
+        """
+        returns the indices, in ascending order, of all objects in the bins
+        overlapping the cone, this is a superset of the objects inside the cone
+        """
+        max_dr += EtaPhiGrid._pad
+        eta_lo = int(math.floor((eta-max_dr-self.eta_min)/self.cell_size))
+        eta_hi = int(math.floor((eta+max_dr-self.eta_min)/self.cell_size))
+        if eta_hi < 0 or eta_lo >= self.nr_eta_bins or len(self.etas)==0:
+            return numpy.zeros(0,dtype=numpy.int64)
+        eta_lo = max(eta_lo,0)
+        eta_hi = min(eta_hi,self.nr_eta_bins-1)
+
+        phi_lo = int(math.floor((phi-max_dr+math.pi)/self.phi_width))
+        phi_hi = int(math.floor((phi+max_dr+math.pi)/self.phi_width))
+        if phi_hi-phi_lo+1 >= self.nr_phi_bins:
+            phi_bins = range(0,self.nr_phi_bins)
+        else:
+            phi_bins = [x % self.nr_phi_bins for x in range(phi_lo,phi_hi+1)]
+
+        slices = []
+        for eta_bin in range(eta_lo,eta_hi+1):
+            for phi_bin in phi_bins:
+                cell_id = eta_bin*self.nr_phi_bins + phi_bin
+                start,end = self.cell_starts[cell_id],self.cell_starts[cell_id+1]
+                if end>start:
+                    slices.append(self.order[start:end])
+        if not slices:
+            return numpy.zeros(0,dtype=numpy.int64)
+        return numpy.sort(numpy.concatenate(slices))
+
+    def query(self,eta,phi,max_dr):
+        """
+        returns the indices, in ascending order, of the objects with dR <= max_dr
+        """
+        cands = self.candidates(eta,phi,max_dr)
+        deta = self.etas[cands]-eta
+        dphi = delta_phi(self.phis[cands],phi)
+        return cands[deta*deta+dphi*dphi <= max_dr*max_dr]
@@ -0,0 +1,171 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import hashlib
+import json
+import numpy
+
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
+from Analysis.HLTAnalyserPy.NtupTools import TreeVar
+
+"""
+declarative ntuple schemas
+
+a schema file (json or yaml) lists for each collection the branches to make
+and how to fill them, eg
+
+{
+  "params" : {"prod_tag" : "Unseeded"},
+  "collections" : {
+    "eg" : {
+      "type" : "trigger::EgammaObject",
+      "branches" : [
+        ["et/F", "et()"],
+        ["nrClus/I", "superCluster().clusters().size()"],
+        ["sigmaIEtaIEta/F", {"var" : "hltEgammaClusterShape{prod_tag}_sigmaIEtaIEta5x5"}]
+      ]
+    }
+  }
+}
+
+the sources are either UnaryFunc string expressions or {"var" : name} which
+reads the named variable of a trigger::EgammaObject (0 if it does not exist)
+params are substituted into the expressions using str.format and can be
+overriden when compiling
+
+compile_schema resolves a schema into the branch name / expression list of
+each collection, this is cached in memory and on disk keyed by the hash of
+the schema and params so each schema is only resolved once
+
+CollFillPlan then makes the branches for a collection and fills them, if the
+collection has a c++ type all its expressions are evaluated for all the objects
+in a single JIT compiled call (see JitAccessors)
+"""
+
+use_jit = True
+
+_compiled_schemas = {}
+
+def find_schema_file(filename):
+    """
+    returns the path of a schema file, looking first at the path given and
+    then in the data directory of this package
+    """
+    if os.path.exists(filename):
+        return filename
+    search_dirs = [os.path.join(os.environ.get("CMSSW_BASE",""),"src","Analysis","HLTAnalyserPy","data"),
+                   os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","data")]
+    for search_dir in search_dirs:
+        path = os.path.join(search_dir,filename)
+        if os.path.exists(path):
+            return path
+    raise IOError("schema file {} not found, searched {}".format(filename,search_dirs))
+
+def load_schema(filename):
+    """
+    loads a schema from a json or yaml (requires PyYAML) file
+    """
+    with open(find_schema_file(filename)) as f:
+        if filename.endswith((".yaml",".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("yaml schema files require PyYAML, use json instead")
+            return yaml.safe_load(f)
+        else:
+            return json.load(f)
+
+def _resolve_source(source,params):
+    if isinstance(source,dict):
+        if "var" in source:
+            return 'var("{}",0)'.format(source["var"].format(**params))
+        raise ValueError("source {} not understood, must be a string expression or have a 'var' key".format(source))
+    return source.format(**params)
+
+def get_schema_hash(schema,params={}):
+    schema_str = json.dumps({"schema" : schema,"params" : params},sort_keys=True)
+    return hashlib.sha1(schema_str.encode("utf-8")).hexdigest()
+
+def compile_schema(schema,params={},use_disk_cache=True):
+    """
+    resolves the schema for the given params (which override the schema defaults)
+    returns a dict of collection name to
+       {"type" : c++ type or None, "branches" : [[branch name, expression],...]}
+    """
+    all_params = dict(schema.get("params",{}))
+    all_params.update(params)
+    schema_hash = get_schema_hash(schema,all_params)
+    if schema_hash in _compiled_schemas:
+        return _compiled_schemas[schema_hash]
+
+    cache_filename = os.path.join(CoreTools.get_cache_dir(),"ntupschema_{}.json".format(schema_hash)) if use_disk_cache else None
+    compiled = None
+    if cache_filename and os.path.exists(cache_filename):
+        try:
+            with open(cache_filename) as f:
+                compiled = json.load(f)
+        except ValueError:
+            compiled = None
+
+    if compiled is None:
+        compiled = {}
+        for coll_name,coll in schema["collections"].items():
+            branches = []
+            branch_names = set()
+            for name,source in coll["branches"]:
+                if name in branch_names:
+                    raise ValueError("branch {} defined twice for collection {}".format(name,coll_name))
+                branch_names.add(name)
+                branches.append([name,_resolve_source(source,all_params)])
+            compiled[coll_name] = {"type" : coll.get("type"),"branches" : branches}
+        if cache_filename:
+            tmp_filename = "{}.{}.tmp".format(cache_filename,os.getpid())
+            with open(tmp_filename,"w") as f:
+                json.dump(compiled,f)
+            os.rename(tmp_filename,cache_filename)
+
+    _compiled_schemas[schema_hash] = compiled
+    return compiled
+
+class CollFillPlan:
+    """
+    makes the branches of a compiled schema collection and fills them from a
+    list of objects, objects which are None (eg unmatched) are filled with 0
+       tree = tree to add the branches to
+       coll = compiled schema collection (see compile_schema)
+       prefix = prefix of the branch names (eg eg_)
+       sizevar = name of the branch with the number of objects
+       maxsize = initial size of the branch arrays
+       exclude = branch names (without prefix, the type is ignored) not to make, eg as they are overriden
+    """
+    def __init__(self,tree,coll,prefix,sizevar,maxsize=20,exclude=()):
+        exclude_names = set(name.split("/")[0] for name in exclude)
+        self.branches = [(name,expr) for name,expr in coll["branches"] if name.split("/")[0] not in exclude_names]
+        self.tree_vars = [TreeVar(tree,prefix+name,UnaryFunc(str(expr)),maxsize,sizevar) for name,expr in self.branches]
+        self.accessor = None
+        if use_jit and coll["type"] and self.branches:
+            try:
+                from Analysis.HLTAnalyserPy.JitAccessors import JitAccessor
+                self.accessor = JitAccessor(coll["type"],[expr for name,expr in self.branches])
+            except Exception as err:
+                print("CollFillPlan: could not JIT compile the branches of {}, filling in python\n  {}".format(coll["type"],err))
+                self.accessor = None
+
+    def fill(self,objs):
+        if self.accessor is None:
+            for var_ in self.tree_vars:
+                var_.fill_from(objs)
+            return
+
+        valid_indices = [objnr for objnr,obj in enumerate(objs) if obj is not None]
+        if len(valid_indices)==len(objs):
+            vals = self.accessor.evaluate(objs)
+        else:
+            vals = numpy.zeros((len(self.tree_vars),len(objs)))
+            if valid_indices:
+                vals[:,valid_indices] = self.accessor.evaluate([objs[objnr] for objnr in valid_indices])
+        for varnr,var_ in enumerate(self.tree_vars):
+            var_.fill_many(vals[varnr])
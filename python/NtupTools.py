@@ -1,4 +1,6 @@
 from array import array
+import numpy
+from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
 
 def treetype_to_arraytype(treetype):
     if treetype=='I': 
@@ -30,34 +32,86 @@ class TreeVar:
        tree = tree to add branch to
        varnametype = name of branch and root type eg foo/F
        func = a unary callable object which acts on the object the branch is being filled from
-       maxsize = maxmimum number of objects storable  (sets the size of the storing array)     
+       maxsize = initial number of objects storable (sets the starting size of the storing array), 
+                 for array branches this grows as needed so it is not a hard limit
        sizevar = a string if specified giving the number of objects stored in the branch for that entry, if empty the branch is just a single variable
     """
        
     def __init__(self,tree,varnametype,func,maxsize=1,sizevar=""):
         self.varname = varnametype.split("/")[0]
         self.vartype = varnametype.split("/")[1]
-        self.func = func
-        self.data = array(treetype_to_arraytype(self.vartype),[0]*maxsize)
+        #skip the UnaryFunc call overhead by using its compiled callable directly
+        self.func = func.compiled if isinstance(func,UnaryFunc) else func
+        self.arraytype = treetype_to_arraytype(self.vartype)
+        self.data = array(self.arraytype,[0]*max(maxsize,1))
+        #the number of entries which may be non-zero, only these need clearing
+        self.nr_used = 0
+        #numpy view of self.data for bulk fills, made when first needed
+        self.data_view = None
         self.sizevar = sizevar
         self.create_branch(tree)
 
     def create_branch(self,tree):       
-        tree.Branch(self.varname,self.data,make_leaf_name(self.varname,self.vartype,self.sizevar))
+        self.branch = tree.Branch(self.varname,self.data,make_leaf_name(self.varname,self.vartype,self.sizevar))
+
+    def grow(self,min_size):
+        """
+        increases the size of the storing array to at least min_size, doubling it
+        each time so its only resized a few times, as the array may move in memory
+        the branch is then pointed to its new location
+        """
+        new_size = len(self.data)
+        while new_size<min_size:
+            new_size *= 2
+        #an array can not be resized while numpy has a view of it
+        self.data_view = None
+        self.data.extend(array(self.arraytype,[0]*(new_size-len(self.data))))
+        self.branch.SetAddress(self.data)
         
     def fill(self,obj,objnr=0):
         val = self.func(obj) if self.func else obj
+        if objnr>=len(self.data) and self.sizevar:
+            self.grow(objnr+1)
         try:
             self.data[objnr] = val 
         except (IndexError,TypeError) as err:
             #much easier in python3, small hack here for 2.7
-            err.message = "for var {} with objnr {} {} type {} error: '{}'".format(self.varname,objnr,len(self.data),self.vartype,err.message)
+            err.message = "for var {} with objnr {} {} type {} error: '{}'".format(self.varname,objnr,len(self.data),self.vartype,getattr(err,"message",str(err)))
             err.args = (err.message,) + err.args[1:] 
             raise err
+        if objnr>=self.nr_used:
+            self.nr_used = objnr+1
 
+    def fill_many(self,vals):
+        """
+        fills the first len(vals) entries of an array branch from a sequence or
+        numpy array of values in one bulk copy rather than element by element
+        """
+        if not self.sizevar:
+            raise ValueError("var {} is not an array so can not be filled with multiple values".format(self.varname))
+        nr_vals = len(vals)
+        if nr_vals>len(self.data):
+            self.grow(nr_vals)
+        if self.data_view is None:
+            self.data_view = numpy.frombuffer(self.data,dtype=numpy.dtype(self.arraytype))
+        self.data_view[:nr_vals] = vals
+        if nr_vals>self.nr_used:
+            self.nr_used = nr_vals
 
-    def clear(self):
-        for n,x in enumerate(self.data):
-            self.data[n] = 0
+    def fill_from(self,objs):
+        """
+        fills the branch with the values of the function for each object in objs
+        with objs which are None being filled with zero, eg unmatched objects
+        """
+        func = self.func
+        if func:
+            self.fill_many([func(obj) if obj is not None else 0 for obj in objs])
+        else:
+            self.fill_many([obj if obj is not None else 0 for obj in objs])
 
+    def clear(self):
+        """zeros the entries filled since the last clear in a single slice assignment"""
+        if self.nr_used:
+            self.data[:self.nr_used] = array(self.arraytype,[0])*self.nr_used
+            self.nr_used = 0
 
@@ -0,0 +1,362 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ROOT
+import os
+import shutil
+import subprocess
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import Analysis.HLTAnalyserPy.FileMetadata as FileMetadata
+
+"""
+runs a script over a set of input files in parallel processes and merges the
+outputs
+
+the files are split into work units with similar numbers of events (rather
+than similar numbers of files), each unit is run as a separate process, a
+unit which fails is retried and the outputs are merged by hadd as the units
+finish in a tree of partial merges so the output is ready shortly after the
+last unit finishes
+
+the processes are managed from a small thread pool which just waits on them
+so a new unit is started as soon as one finishes, the pool takes the units
+from a shared queue so with more units than processes a process which
+finishes early just takes the next one
+
+optionally large files can be split into entry ranges so the wall time is
+set by the total number of events rather than the largest file
+
+the script being run must take the input files as its positional arguments
+and the output filename as -o
+"""
+
+def get_nr_events(filenames,nr_procs=8,verbose=False):
+    """
+    returns a dict of filename : number of events, files which can not be
+    opened have None
+    the counts come from the file metadata cache (see FileMetadata) which is
+    shared with fileChecker.py so files are only re-read if their mtime or
+    size changes
+    """
+    metadata = FileMetadata.get_file_metadata(filenames,nr_procs=nr_procs,verbose=verbose)
+    return {filename : meta['nr_events'] for filename,meta in metadata.items()}
+
+def make_work_units(filenames,nr_units,nr_events=None):
+    """
+    splits the files into nr_units lists with as equal numbers of events as
+    possible, the largest files are assigned first each to the unit with
+    the fewest events so far
+    files with unknown numbers of events are counted as the mean file size
+    the order of the files within a unit is the input order
+    """
+    if nr_events is None:
+        nr_events = get_nr_events(filenames)
+    known_counts = [nr for nr in nr_events.values() if nr is not None]
+    default_count = sum(known_counts)//len(known_counts) if known_counts else 1
+    counts = [nr_events.get(filename) for filename in filenames]
+    counts = [count if count is not None else default_count for count in counts]
+
+    nr_units = max(1,min(nr_units,len(filenames)))
+    unit_files = [[] for unitnr in range(nr_units)]
+    unit_counts = [0]*nr_units
+    for filenr in sorted(range(len(filenames)),key=lambda x : counts[x],reverse=True):
+        unitnr = unit_counts.index(min(unit_counts))
+        unit_files[unitnr].append(filenr)
+        unit_counts[unitnr] += counts[filenr]
+    return [[filenames[filenr] for filenr in sorted(filenrs)] for filenrs in unit_files if filenrs]
+
+class WorkItem:
+    """
+    a piece of work, either a set of whole files or an entry range of a
+    single file
+       entry_range = (first entry, nr entries) or None for the whole files
+    """
+    def __init__(self,filenames,nr_events,entry_range=None):
+        self.filenames = list(filenames)
+        self.nr_events = nr_events
+        self.entry_range = entry_range
+
+    def get_args(self):
+        args = list(self.filenames)
+        if self.entry_range:
+            args.extend(["--entry_range",str(self.entry_range[0]),str(self.entry_range[1])])
+        return args
+
+def make_work_items(filenames,max_events,nr_events=None):
+    """
+    splits the files into items of at most max_events events, files larger
+    than that are split into entry ranges and smaller files are grouped
+    together in input order
+    files with unknown numbers of events are each their own item
+    the items are in input order
+    """
+    if nr_events is None:
+        nr_events = get_nr_events(filenames)
+    max_events = max(1,int(max_events))
+    items = []
+    group = []
+    group_events = 0
+    for filename in filenames:
+        file_events = nr_events.get(filename)
+        if group and (file_events is None or group_events+file_events>max_events):
+            items.append(WorkItem(group,group_events))
+            group = []
+            group_events = 0
+        if file_events is None:
+            items.append(WorkItem([filename],max_events))
+        elif file_events>max_events:
+            nr_ranges = (file_events+max_events-1)//max_events
+            range_size = (file_events+nr_ranges-1)//nr_ranges
+            for first_entry in range(0,file_events,range_size):
+                nr_range_events = min(range_size,file_events-first_entry)
+                items.append(WorkItem([filename],nr_range_events,(first_entry,nr_range_events)))
+        else:
+            group.append(filename)
+            group_events += file_events
+    if group:
+        items.append(WorkItem(group,group_events))
+    return items
+
+class Job:
+    """
+    a command to run as a separate process
+       name = name for printouts
+       cmd = the command as a list of arguments
+       out_filename = if set, the job has only succeeded if this file exists
+       parse_func = if set, called with the stdout of the job and its return value
+                    stored as .result, the job has failed if it raises a ValueError
+    """
+    def __init__(self,name,cmd,out_filename=None,parse_func=None):
+        self.name = name
+        self.cmd = [str(x) for x in cmd]
+        self.out_filename = out_filename
+        self.parse_func = parse_func
+        self.result = None
+        self.succeeded = False
+        self.nr_tries = 0
+        self.run_time = 0.
+
+    def run(self):
+        self.nr_tries += 1
+        if self.out_filename and os.path.exists(self.out_filename):
+            os.remove(self.out_filename)
+        start_time = time.time()
+        stdout = subprocess.PIPE if self.parse_func else None
+        proc = subprocess.Popen(self.cmd,stdout=stdout)
+        out,err = proc.communicate()
+        self.run_time = time.time()-start_time
+
+        self.succeeded = proc.returncode==0
+        if self.succeeded and self.out_filename:
+            self.succeeded = os.path.exists(self.out_filename)
+        if self.succeeded and self.parse_func:
+            try:
+                self.result = self.parse_func(out.decode("utf-8") if isinstance(out,bytes) else out)
+            except ValueError:
+                self.succeeded = False
+        return self.succeeded
+
+def _run_job(job_and_retries):
+    job,max_retries = job_and_retries
+    while not job.run() and job.nr_tries<=max_retries:
+        print("job {} failed (try {}), retrying".format(job.name,job.nr_tries))
+    return job
+
+def run_jobs(jobs,nr_procs=8,max_retries=2,on_done=None,verbose=True):
+    """
+    runs the jobs with at most nr_procs at once, a failed job is retried up to
+    max_retries times
+    on_done(job) is called as each job finishes (successfully or not) in the
+    calling thread
+    returns the jobs which failed
+    """
+    failed_jobs = []
+    if not jobs:
+        return failed_jobs
+    pool = ThreadPool(max(1,min(nr_procs,len(jobs))))
+    try:
+        for job in pool.imap_unordered(_run_job,[(job,max_retries) for job in jobs]):
+            if verbose:
+                print("job {} {} in {:.0f}s".format(job.name,"done" if job.succeeded else "failed",job.run_time))
+            if not job.succeeded:
+                failed_jobs.append(job)
+            if on_done:
+                on_done(job)
+    finally:
+        pool.close()
+        pool.join()
+    return failed_jobs
+
+def merge_outputs(out_filename,in_filenames,fast=True):
+    """
+    merges the root files like hadd, trees are fast merged (the baskets are
+    copied without decompressing) when fast is True
+    returns True if successful
+    """
+    merger = ROOT.TFileMerger(False,False)
+    merger.SetFastMethod(fast)
+    if not merger.OutputFile(out_filename,"RECREATE"):
+        return False
+    for in_filename in in_filenames:
+        if not merger.AddFile(in_filename,False):
+            return False
+    return bool(merger.Merge())
+
+def get_merge_cmd(out_filename,in_filenames):
+    """
+    hadd with -fk so the tree baskets are copied as they are without being
+    recompressed
+    """
+    return ["hadd","-fk",out_filename]+list(in_filenames)
+
+class StreamingMerger:
+    """
+    merges the parts as they are produced rather than all at the end
+
+    the parts are merged in groups of fan_in consecutive parts as soon as all
+    of a group are done, the results of those merges are then merged in
+    groups of fan_in and so on until there is a single file, so the output
+    is in part order regardless of the order the parts finish in
+    the merges run as separate processes, at most nr_procs at once
+       out_filename = the final output
+       nr_parts = the number of parts which will be produced
+       keep_parts = if False, the parts are deleted once merged
+    """
+    def __init__(self,out_filename,nr_parts,fan_in=8,nr_procs=2,max_retries=1,keep_parts=False):
+        self.out_filename = out_filename
+        self.fan_in = max(2,fan_in)
+        self.max_retries = max_retries
+        self.keep_parts = keep_parts
+        #number of files at each level of the tree, the last level has one
+        self.level_sizes = [nr_parts]
+        while self.level_sizes[-1]>1:
+            self.level_sizes.append((self.level_sizes[-1]+self.fan_in-1)//self.fan_in)
+        self.done = [{} for level in self.level_sizes]
+        self.failed = False
+        self.lock = threading.Lock()
+        self.pool = ThreadPool(max(1,nr_procs))
+        self.pending = []
+
+    def _get_merge_filename(self,level,index):
+        if level==len(self.level_sizes)-1:
+            return self.out_filename
+        return "{}.merge{}_{}.root".format(self.out_filename,level,index)
+
+    def part_done(self,partnr,filename):
+        """
+        adds a finished part, thread safe
+        """
+        self._add(0,partnr,filename)
+
+    def _add(self,level,index,filename):
+        with self.lock:
+            self.done[level][index] = filename
+            if level==len(self.level_sizes)-1:
+                return
+            group = index//self.fan_in
+            indices = range(group*self.fan_in,min((group+1)*self.fan_in,self.level_sizes[level]))
+            if not all(x in self.done[level] for x in indices):
+                return
+            in_filenames = [self.done[level][x] for x in indices]
+        out_filename = self._get_merge_filename(level+1,group)
+        job = Job("merge{}_{}".format(level+1,group),get_merge_cmd(out_filename,in_filenames),out_filename=out_filename)
+        self.pending.append(self.pool.apply_async(self._merge,(job,level,in_filenames,group)))
+
+    def _merge(self,job,level,in_filenames,group):
+        _run_job((job,self.max_retries))
+        if not job.succeeded:
+            print("error: merge {} failed, keeping its inputs".format(job.name))
+            self.failed = True
+            return
+        if level>0 or not self.keep_parts:
+            for filename in in_filenames:
+                os.remove(filename)
+        self._add(level+1,group,job.out_filename)
+
+    def finish(self):
+        """
+        waits for the merges to finish, returns True if the output was made 
+        or there were no parts to merge
+        """
+        #merges can add further merges so wait until none are left
+        while self.pending:
+            self.pending.pop(0).wait()
+        self.pool.close()
+        self.pool.join()
+        if self.level_sizes==[0]:
+            #no parts so there is nothing to merge and no output
+            return True
+        if self.level_sizes==[1] and 0 in self.done[0]:
+            #a single part, nothing to merge
+            if self.keep_parts:
+                shutil.copyfile(self.done[0][0],self.out_filename)
+            else:
+                os.rename(self.done[0][0],self.out_filename)
+            return True
+        return not self.failed and len(self.done[-1])==1
+
+def get_part_filename(out_filename,partnr):
+    if out_filename.find(".root")!=-1:
+        return out_filename.replace(".root","_{}.root".format(partnr))
+    else:
+        return "{}_{}".format(out_filename,partnr)
+
+def run_parallel(cmd,in_filenames,out_filename,nr_procs=8,nr_units=None,max_retries=2,merge=True,keep_parts=False,split_files=False,items_per_proc=4,merge_fan_in=8):
+    """
+    runs cmd (a list of arguments or a string to split) over the input files
+    in parallel, each work unit writing to its own part file which are
+    merged into out_filename as they finish (see StreamingMerger)
+    nr_units defaults to nr_procs
+
+    if split_files is True, the input is instead split into about
+    items_per_proc*nr_procs items with large files split into entry ranges,
+    the items are pulled from a shared queue by the processes as they become
+    free so no process is left waiting on a slow unit, cmd must accept
+    --entry_range first nr
+    returns True if all units succeeded (and the merge if requested)
+    """
+    if not isinstance(cmd,list):
+        cmd = cmd.split()
+    if split_files:
+        nr_events = get_nr_events(in_filenames,nr_procs=nr_procs)
+        tot_events = sum(nr for nr in nr_events.values() if nr is not None)
+        max_events = tot_events/(items_per_proc*nr_procs) if tot_events else 1
+        items = make_work_items(in_filenames,max_events,nr_events)
+        unit_args = [item.get_args() for item in items]
+        unit_sizes = [item.nr_events for item in items]
+    else:
+        nr_units = nr_units if nr_units else nr_procs
+        unit_args = make_work_units(in_filenames,nr_units)
+        unit_sizes = [0]*len(unit_args)
+
+    jobs = []
+    for unitnr,args in enumerate(unit_args):
+        part_filename = get_part_filename(out_filename,unitnr)
+        jobs.append(Job("{}".format(unitnr),cmd+args+["-o",part_filename],out_filename=part_filename))
+
+    if not jobs:
+        print("no work units made from the {} input files, nothing to do".format(len(in_filenames)))
+        return True
+    print("running {} work units over {} files".format(len(jobs),len(in_filenames)))
+    merger = StreamingMerger(out_filename,len(jobs),fan_in=merge_fan_in,nr_procs=max(1,nr_procs//4),keep_parts=keep_parts) if merge else None
+    part_nrs = {job.name : jobnr for jobnr,job in enumerate(jobs)}
+    def on_done(job):
+        if merger and job.succeeded:
+            merger.part_done(part_nrs[job.name],job.out_filename)
+
+    #largest first so a large unit is not left to the end, the parts are
+    #still merged in input order
+    run_order = sorted(range(len(jobs)),key=lambda x : unit_sizes[x],reverse=True)
+    failed_jobs = run_jobs([jobs[jobnr] for jobnr in run_order],nr_procs,max_retries,on_done=on_done)
+    merged = merger.finish() if merger else True
+    if failed_jobs:
+        print("error: units {} failed, the output is incomplete".format(" ".join(job.name for job in failed_jobs)))
+        return False
+    if not merged:
+        print("error: merging into {} failed, the partial merges are kept".format(out_filename))
+        return False
+    return True
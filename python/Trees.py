@@ -3,8 +3,10 @@ import Analysis.HLTAnalyserPy.CoreTools as CoreTools
 import Analysis.HLTAnalyserPy.TrigTools as TrigTools
 import Analysis.HLTAnalyserPy.GenTools as GenTools
 import Analysis.HLTAnalyserPy.L1Tools as L1Tools
+import Analysis.HLTAnalyserPy.MatchTools as MatchTools
 from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
 from Analysis.HLTAnalyserPy.NtupTools import TreeVar
+import Analysis.HLTAnalyserPy.NtupSchema as NtupSchema
 from Analysis.HLTAnalyserPy.EvtWeights import EvtWeights
 
 from functools import partial
@@ -13,8 +15,11 @@ from array import array
 import six
 
 class EgHLTTree:
-    def __init__(self,tree_name,evtdata,min_et=0.,weights=None):
-        self.tree = ROOT.TTree(tree_name,'')
+    """
+    tree = tree to fill, defaults to a new TTree, can be a ColumnarWriter.ColumnarTree
+    """
+    def __init__(self,tree_name,evtdata,min_et=0.,weights=None,tree=None):
+        self.tree = tree if tree is not None else ROOT.TTree(tree_name,'')
         self.l1seeded = True
         self.evtdata = evtdata
         self.min_et = min_et
@@ -48,89 +53,24 @@ class EgHLTTree:
         self.evtdatavars.append(TreeVar(self.tree,"rho/F",UnaryFunc('get_fundtype("rho",0)')))
             
             
-        max_pthats = 400
+        max_pthats = 400 #initial size, grows if needed
         self.nr_pthats = TreeVar(self.tree,"nrPtHats/i",UnaryFunc(partial(len)))
         self.pthats = TreeVar(self.tree,"ptHats/F",None,maxsize=max_pthats,sizevar="nrPtHats")
             
         egobjnr_name = "nrEgs"
-        max_egs = 200    
+        max_egs = 20 #initial size, grows if needed
         self.egobj_nr = TreeVar(self.tree,egobjnr_name+"/i",UnaryFunc(partial(len)))
        
         prod_tag = "L1Seeded" if self.l1seeded else "Unseeded" 
 
-        vars_ = {
-            'et/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.et)),
-            'energy/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.energy)),
-            'rawEnergy/F' : UnaryFunc("superCluster().rawEnergy()"),
-            'eta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.eta)),
-            'phi/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.phi)),
-            'phiWidth/F':UnaryFunc("superCluster().phiWidth()"),
-            'nrClus/I':UnaryFunc("superCluster().clusters().size()"),
-            'seedId/i':UnaryFunc("superCluster().seed().seed().rawId()"),
-            'seedDet/I':UnaryFunc("superCluster().seed().seed().det()"),
-            'sigmaIEtaIEta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaClusterShape{}_sigmaIEtaIEta5x5".format(prod_tag),0)),
-            'ecalPFIsol_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaEcalPFClusterIso{}".format(prod_tag),0)),
-            'hcalPFIsol_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaHcalPFClusterIso{}".format(prod_tag),0)),
-            'hgcalPFIsol_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaHGCalPFClusterIso{}".format(prod_tag),0)),
-            'trkIsolV0/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaEleGsfTrackIso{}".format(prod_tag),0)),
-            'trkIsolV6_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaEleGsfTrackIsoV6{}".format(prod_tag),0)),
-            'trkIsolV72_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaEleGsfTrackIsoV72{}".format(prod_tag),0)),
-            'trkChi2_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_Chi2".format(prod_tag),0)),
-            'trkMissHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_MissingHits".format(prod_tag),0)),
-            'trkValidHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_ValidHits".format(prod_tag),0)),
-            'invESeedInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_OneOESeedMinusOneOP".format(prod_tag),0)),
-            'invEInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_OneOESuperMinusOneOP".format(prod_tag),0)),
-            'trkDEta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_Deta".format(prod_tag),0)),
-            'trkDEtaSeed/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_DetaSeed".format(prod_tag),0)),
-            'trkDPhi/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,"hltEgammaGsfTrackVars{}_Dphi".format(prod_tag),0)), 
-            'trkNrLayerIT/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaGsfTrackVars{}_NLayerIT'.format(prod_tag),0)),
-            'rVar/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_rVar'.format(prod_tag),0)),
-            'sigma2uu/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2uu'.format(prod_tag),0)),
-            'sigma2vv/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2vv'.format(prod_tag),0)),
-            'sigma2ww/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2ww'.format(prod_tag),0)),
-            'sigma2xx/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2xx'.format(prod_tag),0)),
-            'sigma2xy/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2xy'.format(prod_tag),0)),
-            'sigma2yy/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2yy'.format(prod_tag),0)),
-            'sigma2yz/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2yz'.format(prod_tag),0)),
-            'sigma2zx/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2zx'.format(prod_tag),0)),
-            'sigma2zz/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_sigma2zz'.format(prod_tag),0)),
-            'pms2_default/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaPixelMatchVars{}_s2'.format(prod_tag),0)),
-            'hgcalHForHoverE/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCALIDVars{}_hForHOverE'.format(prod_tag),0)),
-            'hcalHForHoverE/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHoverE{}'.format(prod_tag),0)), 
-            'l1TrkIsoCMSSW/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaEleL1TrkIso{}'.format(prod_tag),0)),
-            
-            'bestTrkChi2/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_Chi2'.format(prod_tag),0)),
-            'bestTrkDEta/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_Deta'.format(prod_tag),0)),
-            'bestTrkDEtaSeed/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_DetaSeed'.format(prod_tag),0)),
-            'bestTrkDPhi/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_Dphi'.format(prod_tag),0)),
-            'bestTrkMissHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_MissingHits'.format(prod_tag),0)),
-            'bestTrkNrLayerIT/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_NLayerIT'.format(prod_tag),0)),
-            'bestTrkESeedInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_OneOESeedMinusOneOP'.format(prod_tag),0)),
-            'bestTrkInvEInvP/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_OneOESuperMinusOneOP'.format(prod_tag),0)),
-            'bestTrkValitHits/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaBestGsfTrackVars{}_ValidHits'.format(prod_tag),0)),         
-            'hgcaliso_layerclus/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCalLayerClusterIso{}'.format(prod_tag),0)),
-            'hgcaliso_layerclusem/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCalLayerClusterIso{}_em'.format(prod_tag),0)),
-            'hgcaliso_layerclushad/F' : UnaryFunc(partial(ROOT.trigger.EgammaObject.var,'hltEgammaHGCalLayerClusterIso{}_had'.format(prod_tag),0)),
-
-           
-        }
-        vars_.update(self.eg_extra_vars)
-
+        #the standard e/gamma and gen branches are defined in data/egHLTTree.json
+        schema = NtupSchema.compile_schema(NtupSchema.load_schema("egHLTTree.json"),{"prod_tag" : prod_tag})
+        self.egobj_plan = NtupSchema.CollFillPlan(self.tree,schema["eg"],"eg_",egobjnr_name,max_egs,exclude=self.eg_extra_vars)
         self.egobj_vars = []        
-        for name,func in six.iteritems(vars_):
+        for name,func in six.iteritems(self.eg_extra_vars):
             self.egobj_vars.append(TreeVar(self.tree,"eg_"+name,func,max_egs,egobjnr_name))
             
-        gen_vars_names = {
-            'energy/F' : UnaryFunc(partial(ROOT.reco.GenParticle.energy)),
-            'pt/F' : UnaryFunc(partial(ROOT.reco.GenParticle.pt)),
-            'et/F' : UnaryFunc(partial(ROOT.reco.GenParticle.et)),
-            'eta/F' : UnaryFunc(partial(ROOT.reco.GenParticle.eta)),
-            'phi/F' : UnaryFunc(partial(ROOT.reco.GenParticle.phi)),
-            'vz/F' : UnaryFunc(partial(ROOT.reco.GenParticle.vz)),
-        }
-        self.gen_vars = []
-        for name,func in six.iteritems(gen_vars_names):
-            self.gen_vars.append(TreeVar(self.tree,"eg_gen_"+name,func,max_egs,egobjnr_name))
+        self.gen_plan = NtupSchema.CollFillPlan(self.tree,schema["gen"],"eg_gen_",egobjnr_name,max_egs)
         
         scales_params = L1Tools.make_egscale_dict()
         l1pho_vars_names = {
@@ -187,8 +127,7 @@ class EgHLTTree:
         pt_hats.append(self.evtdata.get("geninfo").qScale())
         pt_hats.sort(reverse=True)
         self.nr_pthats.fill(pt_hats)
-        for pt_hat_nr,pt_hat in enumerate(pt_hats):
-            self.pthats.fill(pt_hat,pt_hat_nr)
+        self.pthats.fill_many(pt_hats)
             
         egobjs_raw = self.evtdata.get("egtrigobjs_l1seed") if self.l1seeded else self.evtdata.get("egtrigobjs") 
         egobjs = [eg for eg in egobjs_raw if eg.et()>self.min_et]
@@ -205,33 +144,27 @@ class EgHLTTree:
         l1eles_hgcal = self.evtdata.get("l1tkeles_hgcal") 
         l1eles = [eg for eg in itertools.chain(l1eles_eb,l1eles_hgcal)]
         self.egobj_nr.fill(egobjs)
-        for var_ in itertools.chain(self.gen_vars,self.l1pho_vars,self.l1ele_vars):
-            var_.clear()
         
         gen_eles = GenTools.get_genparts(self.evtdata.get("genparts"),
                                          pid=11,antipart=True,
                                          status=GenTools.PartStatus.PREFSR)
        
         good_l1phos = [obj for obj in l1phos if L1Tools.pass_eg_qual(obj) ]
+        gen_matches = MatchTools.get_best_dr_matches(egobjs,gen_eles,0.1)
+        l1pho_matches = MatchTools.get_best_dr_matches(egobjs,good_l1phos,0.2)
 
-        for objnr,obj in enumerate(egobjs):
-            for var_ in self.egobj_vars:                
-                var_.fill(obj,objnr)
+        l1ele_matches = [L1Tools.get_l1ele_from_l1pho(l1pho_obj,l1eles) if l1pho_obj else None for l1pho_obj in l1pho_matches]
 
-            gen_obj = CoreTools.get_best_dr_match(obj,gen_eles,0.1)
-            if gen_obj:
-                for var_ in self.gen_vars:
-                    var_.fill(gen_obj,objnr)
+        #each variable is filled for all objects at once, unmatched objects are filled with 0
+        self.egobj_plan.fill(egobjs)
+        for var_ in self.egobj_vars:
+            var_.fill_from(egobjs)
+        self.gen_plan.fill(gen_matches)
+        for var_ in self.l1pho_vars:
+            var_.fill_from(l1pho_matches)
+        for var_ in self.l1ele_vars:
+            var_.fill_from(l1ele_matches)
 
-            l1pho_obj = CoreTools.get_best_dr_match(obj,good_l1phos,0.2)
-            l1ele_obj = L1Tools.get_l1ele_from_l1pho(l1pho_obj,l1eles) if l1pho_obj else None
-            if l1pho_obj:
-                for var_ in self.l1pho_vars:
-                    var_.fill(l1pho_obj,objnr)
-            if l1ele_obj:
-                for var_ in self.l1ele_vars:
-                    var_.fill(l1ele_obj,objnr)
-                    
 
         self.trig_res.fill(self.evtdata)
         for var_ in self.trig_vars:
@@ -241,8 +174,8 @@ class EgHLTTree:
 
 
 class HLTRateTree:
-    def __init__(self,tree_name,weights_file,trig_res_name):
-        self.tree = ROOT.TTree(tree_name,"")
+    def __init__(self,tree_name,weights_file,trig_res_name,tree=None):
+        self.tree = tree if tree is not None else ROOT.TTree(tree_name,"")
         self.initialised = False
         self.gen_filters = TrigTools.TrigResults(["Gen_QCDMuGenFilter",
                                                   "Gen_QCDEmEnrichingNoBCToEFilter"])
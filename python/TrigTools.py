@@ -130,6 +130,18 @@ class MenuPathRates:
                 trig.weights += weight
                 trig.weights_sq += weight_sq
             
+    def get_checkpoint_state(self):
+        return [[trig.indx,trig.name,trig.counts,trig.weights,trig.weights_sq] for trig in self.trigs]
+
+    def set_checkpoint_state(self,state):
+        self.trigs = []
+        for indx,name,counts,weights,weights_sq in state:
+            trig = MenuPathRates.TrigData(indx,name)
+            trig.counts = counts
+            trig.weights = weights
+            trig.weights_sq = weights_sq
+            self.trigs.append(trig)
+
     def get_results(self):
         results = {}
         for trig in self.trigs:
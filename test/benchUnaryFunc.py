@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import functools
+import timeit
+
+from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
+
+"""
+micro-benchmark of UnaryFunc against the original implementation which 
+decided the dispatch and resolved the method chain on every call
+
+uses plain python objects so it only measures the python overhead
+"""
+
+class LegacyStrFunc:
+    def __init__(self,name,iscallable,args):
+        self.name = name
+        self.iscallable = iscallable
+        self.args = args
+
+    def __call__(self,obj):
+        if not self.iscallable:
+            return getattr(obj,self.name)
+        else :
+            return getattr(obj,self.name)(*self.args)
+
+class LegacyChainedFunc:
+    def __init__(self,funcs):
+        self.funcs = funcs
+
+    def __call__(self,obj):
+        for func in self.funcs:
+            obj = func(obj)
+        return obj
+
+class LegacyUnaryFunc:
+    def __init__(self,func,func_type):
+        self.func = func
+        self.func_type = func_type
+
+    def __call__(self,obj):
+        if self.func_type==UnaryFunc.FuncType.str_:
+            return self.func(obj)
+        elif self.func_type==UnaryFunc.FuncType.partial_: 
+            return self.func.func(obj,*self.func.args,**self.func.keywords)
+        elif self.func_type==UnaryFunc.FuncType.default:
+            return self.func(obj)
+
+class Seed:
+    def rawId(self):
+        return 1234
+
+class Cluster:
+    def seed(self):
+        return Seed()
+
+class SuperCluster:
+    def __init__(self):
+        self.energy = 50.
+    def seed(self):
+        return Cluster()
+    def rawEnergy(self):
+        return 45.
+
+class EgObj:
+    def __init__(self):
+        self.sc = SuperCluster()
+    def superCluster(self):
+        return self.sc
+    def var(self,name,default):
+        return 1.
+
+    def et(self):
+        return 30.
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks UnaryFunc')
+    parser.add_argument('--nr_calls','-n',default=1000000,type=int,help='number of calls per func')
+    args = parser.parse_args()
+
+    obj = EgObj()
+    funcs = {
+        "chained str" : (UnaryFunc("superCluster().seed().seed().rawId()"),
+                         LegacyUnaryFunc(LegacyChainedFunc([LegacyStrFunc("superCluster",True,[]),LegacyStrFunc("seed",True,[]),LegacyStrFunc("seed",True,[]),LegacyStrFunc("rawId",True,[])]),UnaryFunc.FuncType.str_)),
+        "member str" : (UnaryFunc("sc.energy"),
+                        LegacyUnaryFunc(LegacyChainedFunc([LegacyStrFunc("sc",False,[]),LegacyStrFunc("energy",False,[])]),UnaryFunc.FuncType.str_)),
+        "partial var" : (UnaryFunc(functools.partial(EgObj.var,"hltEgammaGsfTrackVars_Chi2",0)),
+                         LegacyUnaryFunc(functools.partial(EgObj.var,"hltEgammaGsfTrackVars_Chi2",0),UnaryFunc.FuncType.partial_)),
+        "partial method" : (UnaryFunc(functools.partial(EgObj.et)),
+                            LegacyUnaryFunc(functools.partial(EgObj.et),UnaryFunc.FuncType.partial_)),
+    }
+    for name,(func,legacy_func) in sorted(funcs.items()):
+        if func(obj)!=legacy_func(obj):
+            raise RuntimeError("{} gives {} but legacy gives {}".format(name,func(obj),legacy_func(obj)))
+        time_new = timeit.timeit(lambda : func.compiled(obj),number=args.nr_calls)
+        time_old = timeit.timeit(lambda : legacy_func(obj),number=args.nr_calls)
+        print("{:<15} legacy {:.3f}s compiled {:.3f}s speed up {:.2f}".format(name,time_old,time_new,time_old/time_new))
+
+if __name__ == "__main__":
+    main()
@@ -64,7 +64,7 @@ class EcalULTree:
             'phi/F' : UnaryFunc(partial(ROOT.reco.RecoEcalCandidate.phi)),
             'seedId/i':UnaryFunc("superCluster().seed().seed().rawId()")
         }
-        max_egs=100
+        max_egs=20 #initial size, grows if needed
         egobjnr_name = "nrEG"
         self.egobj_nr = TreeVar(self.tree,egobjnr_name+"/i",UnaryFunc(partial(len)))
         self.egul_vars = []        
@@ -90,13 +90,10 @@ class EcalULTree:
         combined_egs = combine_scs(evtdata.get("ecalcand_ul"),evtdata.get("ecalcand_run2"),evtdata.get("ecalcand_run3"))
 
         self.egobj_nr.fill(combined_egs)            
-        for objnr,objs in enumerate(combined_egs):
-            for collnr,varcoll in enumerate(self.eg_vars):
-                for var_ in varcoll:
-                    if objs[collnr]:
-                        var_.fill(objs[collnr],objnr)
-                    else:
-                        var_.clear()
+        for collnr,varcoll in enumerate(self.eg_vars):
+            coll_objs = [objs[collnr] if objs[collnr] else None for objs in combined_egs]
+            for var_ in varcoll:
+                var_.fill_from(coll_objs)
 
         self.tree.Fill()
   
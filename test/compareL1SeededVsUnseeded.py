@@ -11,6 +11,7 @@ from DataFormats.FWLite import Events, Handle
 from Analysis.HLTAnalyserPy.EvtData import EvtData, EvtHandles,phaseII_products, add_product,get_objs
 
 import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+from Analysis.HLTAnalyserPy.EvtIndex import to_event
 import Analysis.HLTAnalyserPy.GenTools as GenTools
 import Analysis.HLTAnalyserPy.HistTools as HistTools
 
@@ -42,8 +43,12 @@ def print_l1_region(evtdata,suffix):
         print(print_str)
 
     
-def print_l1(evtdata,events,index):
-    events.to(index)
+def print_l1(evtdata,events,index,evt_index=None):
+    """
+    if an EvtIndex is given, index is instead the (run,lumi,event) of the event
+    """
+    if not to_event(events,index,evt_index):
+        return
     evtdata.get_handles(events)
     print("barrel:")
     print_l1_region(evtdata,"_eb")
@@ -10,29 +10,34 @@ import json
 import re
 import six
 
-def process_dir(dir_,proc_name="HLTX",read_nrtot_directly=False):
-    files = glob.glob(os.path.join(dir_,"*.root"))
+import Analysis.HLTAnalyserPy.FileMetadata as FileMetadata
+
+def process_dir(dir_,proc_name="HLTX",read_nrtot_directly=False,nr_procs=8):
+    """
+    checks the root files in the directory in parallel, the results are
+    cached (see FileMetadata) so only new, modified or bad files are opened again
+    nr_tot is the hltNrInputEvents counter summed over all the entries of the 
+    Runs tree of each file
+    """
+    files = sorted(glob.glob(os.path.join(dir_,"*.root")))
+    counter_name = FileMetadata.get_runs_counter_name(proc_name)
+    counter_names = [counter_name] if not read_nrtot_directly else []
+    metadata = FileMetadata.get_file_metadata(files,counter_names,nr_procs=nr_procs,verbose=True)
     good_files = []
     bad_files = []
     nr_tot = 0.
     nr_pass = 0.
     for file_ in files:
-        root_file = ROOT.TFile.Open(file_,"READ")
-        if not root_file or root_file.IsZombie() or root_file.TestBit(ROOT.TFile.kRecovered):
+        meta = metadata[file_]
+        if not meta['readable'] or (not read_nrtot_directly and meta['counters'].get(counter_name) is None):
             bad_files.append(str(file_))
+            continue
+        nr_pass += meta['nr_events']
+        if not read_nrtot_directly:
+            nr_tot += meta['counters'][counter_name]
         else:
-            try:
-                
-                nr_pass += root_file.Events.GetEntries()
-                if not read_nrtot_directly:
-                    root_file.Runs.GetEntry(0)
-                    nr_tot += getattr(root_file.Runs,"edmMergeableCounter_hltNrInputEvents_nrEventsRun_{proc_name}".format(proc_name=proc_name)).value 
-                else:
-                    nr_tot = nr_pass
-
-                good_files.append(str(file_))
-            except AttributeError:
-                bad_files.append(str(file_))
+            nr_tot = nr_pass
+        good_files.append(str(file_))
 
     return {"nr_pass" : nr_pass,"nr_tot" : nr_tot,
             "good_files" : good_files,"bad_files" : bad_files}
@@ -93,6 +98,7 @@ if __name__ == "__main__":
     parser.add_argument('--clean',action='store_true',help='clean bad files')
     parser.add_argument('--out','-o',default='weights.json',help='output weights json')
     parser.add_argument('--direct','-d',action='store_true',help='read nrtot directly from tree entries')
+    parser.add_argument('--nr_procs','-j',default=8,type=int,help='number of processes to check the files with')
                              
     args = parser.parse_args()
     
@@ -102,7 +108,7 @@ if __name__ == "__main__":
         job_name = dir_.rstrip("/").split("/")[-1]
         job_data[job_name] = {}
         print("processing {}".format(dir_))
-        job_data[job_name]['job_stats'] = process_dir(dir_,"HLTX",args.direct)
+        job_data[job_name]['job_stats'] = process_dir(dir_,"HLTX",args.direct,args.nr_procs)
         #job_data[job_name]['xsec'] = get_xsec(job_name)
         
         
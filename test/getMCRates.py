@@ -13,6 +13,8 @@ from Analysis.HLTAnalyserPy.EvtWeights import EvtWeights
 
 import Analysis.HLTAnalyserPy.CoreTools as CoreTools
 import Analysis.HLTAnalyserPy.TrigTools as TrigTools
+import Analysis.HLTAnalyserPy.ColumnarWriter as ColumnarWriter
+import Analysis.HLTAnalyserPy.Checkpoint as Checkpoint
 from Analysis.HLTAnalyserPy.Trees import HLTRateTree
         
         
@@ -28,7 +30,11 @@ if __name__ == "__main__":
     parser.add_argument('--verbose','-v',action='store_true',help='verbose printouts')
     parser.add_argument('--out_file','-o',default="output.root",help='output filename')
     parser.add_argument('--weights','-w',default=None,help='weights filename')
+    parser.add_argument('--out_format',default="root",choices=["root"]+list(ColumnarWriter.out_formats.keys()),help='output format, for non root formats the extension of the output filename is changed to match')
+    parser.add_argument('--checkpoint_every',default=0,type=int,help='if >0, checkpoints every N events so a job which dies can be resumed by rerunning it (root output only)')
     args = parser.parse_args()
+    if args.checkpoint_every>0 and args.out_format!="root":
+        parser.error("--checkpoint_every requires --out_format root")
 
     weight_calc = EvtWeights(args.weights)
 
@@ -48,10 +54,23 @@ if __name__ == "__main__":
     in_filenames = CoreTools.get_filenames(args.in_filenames,args.prefix)
     events = Events(in_filenames,maxEvents=args.maxevents)
 
-    out_file = ROOT.TFile(args.out_file,"RECREATE")
-    rate_tree = HLTRateTree("rateTree",args.weights,"trig_res_hlt")
+    ckpt = None
+    if args.checkpoint_every>0:
+        ckpt = Checkpoint.Checkpointer(args.out_file,in_filenames,args.checkpoint_every,[0,args.maxevents])
+        out_file = ckpt.open()
+        rate_tree = HLTRateTree("rateTree",args.weights,"trig_res_hlt")
+    elif args.out_format=="root":
+        out_file = ROOT.TFile(args.out_file,"RECREATE")
+        rate_tree = HLTRateTree("rateTree",args.weights,"trig_res_hlt")
+    else:
+        out_file = ColumnarWriter.ColumnarTree("rateTree",ColumnarWriter.get_columnar_filename(args.out_file,args.out_format),args.out_format)
+        rate_tree = HLTRateTree("rateTree",args.weights,"trig_res_hlt",tree=out_file)
 
-    for eventnr,event in enumerate(events):
+    entry_range = None
+    if ckpt:
+        ckpt.add_state("rates",rates)
+        entry_range = ckpt.start()
+    for eventnr,event in enumerate(CoreTools.iter_events(events,entry_range)):
         if eventnr%10000==0:
             elapsed_time = time.time()-start_time
             est_finish = "n/a"
@@ -67,8 +86,13 @@ if __name__ == "__main__":
 #        weight = 1.0
         rates.fill(evtdata,weight)
         rate_tree.fill(evtdata)
+        if ckpt:
+            ckpt.event_done()
     
-    out_file.Write()
+    if ckpt:
+        ckpt.finish()
+    else:
+        out_file.Write()
     with open("test.json",'w') as f:
         json.dump(rates.get_results(),f)
 
@@ -2,12 +2,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import argparse
-import subprocess
 import os
 import sys
 import glob
 
 import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+import Analysis.HLTAnalyserPy.ParallelRunner as ParallelRunner
 
 def main():
     """
@@ -41,27 +41,25 @@ def main():
                   
     script_dir = os.path.dirname(__file__)
     ntup_script = os.path.join(script_dir,"makePhaseIINtup.py")
-    run_script = os.path.join(script_dir,"runMultiThreaded.py")
     for dir_ in dirs_to_run:        
         head,tail = os.path.split(dir_.rstrip("/"))
         base_name = tail if tail else head
         out_file = os.path.join(args.out_dir,"{}.root".format(base_name))
         out_file = out_file.replace(".list.root",".root")
         
-        weights_arg = "-w {}".format(args.weights) if args.weights else ""
-        reg_arg = "--reg_hgcal {}".format(args.reg_hgcal) if args.reg_hgcal else ""
-        ntupcmd = "python {ntup_script} --min_et {a.min_et} -r 5000 {weights_arg} {reg_arg}".format(ntup_script=ntup_script,a=args,weights_arg=weights_arg,reg_arg=reg_arg)
+        ntupcmd = ["python",ntup_script,"--min_et",str(args.min_et),"-r","5000"]
+        if args.weights:
+            ntupcmd.extend(["-w",args.weights])
+        if args.reg_hgcal:
+            ntupcmd.extend(["--reg_hgcal",args.reg_hgcal])
         if dir_.endswith(".list"):
             input_files = CoreTools.get_filenames([dir_])
         else:
             input_files = glob.glob(os.path.join(dir_,"*.root"))
 
-        runcmd = ["python",run_script,"-o",out_file,"--cmd",ntupcmd,"--hadd","-t",str(args.nr_threads),"-j",str(args.nr_threads)]
-        runcmd.extend(input_files)
-        
         print("running {}".format(dir_))
-       
-        subprocess.Popen(runcmd).communicate()
+        if not ParallelRunner.run_parallel(ntupcmd,input_files,out_file,nr_procs=args.nr_threads,split_files=True):
+            print("error processing {}".format(dir_))
     print("all done")
         
         
@@ -11,6 +11,7 @@ from DataFormats.FWLite import Events, Handle
 from Analysis.HLTAnalyserPy.EvtData import EvtData, EvtHandles,phaseII_products, add_product,get_objs
 
 import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+from Analysis.HLTAnalyserPy.EvtIndex import to_event
 import Analysis.HLTAnalyserPy.GenTools as GenTools
 import Analysis.HLTAnalyserPy.HistTools as HistTools
 
@@ -87,7 +88,7 @@ class L1Tree:
             'etThresNonIso/F' : UnaryFunc(partial(L1Tools.eg_thres,scales_params,use_noniso=True)),
             'etThres/F' : UnaryFunc(partial(L1Tools.eg_thres,scales_params))            
             }
-        max_l1egs = 2000
+        max_l1egs = 100 #initial size, grows if needed
         nrpho_name = "nrL1EGs"
         nrele_name = "nrL1Eles"
         self.l1pho_nr = TreeVar(self.tree,nrpho_name+"/i",UnaryFunc(partial(len)))
@@ -121,15 +122,18 @@ class L1Tree:
 #        self.l1ele_nr.fill(l1eles)
         self.l1pho_nr.fill(l1phos)
 
-        for objnr,l1pho_obj in enumerate(l1phos):
-            for var_ in self.l1pho_vars:
-                var_.fill(l1pho_obj,objnr)
+        for var_ in self.l1pho_vars:
+            var_.fill_from(l1phos)
      #   for var_ in self.l1ele_vars:
        #     var_.fill(l1ele_obj,objnr)
         self.tree.Fill()
 
-def print_l1(evtdata,events,index):
-    events.to(index)
+def print_l1(evtdata,events,index,evt_index=None):
+    """
+    if an EvtIndex is given, index is instead the (run,lumi,event) of the event
+    """
+    if not to_event(events,index,evt_index):
+        return
     evtdata.get_handles(events)
     print("barrel:")
     print_l1_region(evtdata,"_eb")
@@ -43,8 +43,8 @@ class L1Tree:
             'phi/F' : UnaryFunc("phi()"),
             'hwQual/F' : UnaryFunc("hwQual()"),          
             }
-        max_l1egs = 2000
-        max_l1mus = 2000
+        max_l1egs = 100 #initial size, grows if needed
+        max_l1mus = 100 #initial size, grows if needed
         nregs_name = "nrEGs"
         nrmus_name = "nrMuons"
         self.l1eg_nr = TreeVar(self.tree,nregs_name+"/i",UnaryFunc(partial(len)))
@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import ROOT
+
+import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+import Analysis.HLTAnalyserPy.ColumnarWriter as ColumnarWriter
+from Analysis.HLTAnalyserPy.EvtData import phaseII_products
+from Analysis.HLTAnalyserPy.EvtWeights import EvtWeights
+from Analysis.HLTAnalyserPy.EvtLoop import EvtLoop,Consumer
+from Analysis.HLTAnalyserPy.Trees import EgHLTTree
+
+from makePhaseIINtup import setup_eghlt_tree,make_eghlt_products
+from makeL1Ntup import L1Tree
+from makeTSGRateNtup import TSGRateTree,TSGHLTPathNameTree,make_tsg_products
+
+"""
+makes the e/gamma HLT ntuple, the L1 ntuple and the TSG rate ntuple in a
+single pass over the input rather than running makePhaseIINtup.py,
+makeL1Ntup.py and makeTSGRateNtup.py separately, each ntuple is only made if
+its output filename is given
+alternatively -o writes the ntuples selected by --ntups to a single root file,
+as needed to run it with runMultiThreaded.py / ParallelRunner
+"""
+
+class TSGRateTrees:
+    """
+    the rate tree and path name tree written to the same file
+    """
+    def __init__(self,evtdata,rate_tree=None):
+        self.rate_tree = TSGRateTree("tsgRateTree",evtdata,tree=rate_tree)
+        self.path_tree = TSGHLTPathNameTree("hltPathNameTree",evtdata)
+    def fill(self):
+        self.rate_tree.fill()
+        self.path_tree.fill()
+
+def main():
+    CoreTools.load_fwlitelibs()
+
+    parser = argparse.ArgumentParser(description='makes several ntuples in one pass over the events')
+    parser.add_argument('in_filenames',nargs="+",help='input filename')
+    parser.add_argument('--prefix','-p',default="",help='prefix to append to input files')
+    parser.add_argument('--eg_out',default=None,help='output filename of the e/gamma HLT ntuple')
+    parser.add_argument('--l1_out',default=None,help='output filename of the L1 ntuple')
+    parser.add_argument('--rate_out',default=None,help='output filename of the TSG rate ntuple')
+    parser.add_argument('--out','-o',default=None,help='single output filename for all the ntuples in --ntups (root format only), instead of --eg_out/--l1_out/--rate_out')
+    parser.add_argument('--ntups',nargs="+",default=["eg","l1","rate"],choices=["eg","l1","rate"],help='the ntuples written to --out')
+    parser.add_argument('--min_et','-m',default=10.,type=float,help='minimum eg et')
+    parser.add_argument('--weights','-w',default=None,help="weights filename")
+    parser.add_argument('--trig_res_tag',default="TriggerResults::HLTX",help='tag of the trigger results')
+    parser.add_argument('--out_format',default="root",choices=["root"]+list(ColumnarWriter.out_formats.keys()),help='format of the e/gamma ntuple and rate tree')
+    parser.add_argument('--report','-r',default=10000,type=int,help="report every N events")
+    parser.add_argument('--maxevents',default=-1,type=int,help="maximum number of events to process")
+    parser.add_argument('--prefetch',default=0,type=int,help='if >0, learns the used products over this many events and then only prefetches those')
+    parser.add_argument('--profile',action='store_true',help='profiles the product access and prints a report at the end')
+    parser.add_argument('--entry_range',nargs=2,default=None,type=int,help='only process the entries first nr (nr<0 is to the end) of the input, as used by ParallelRunner to split files')
+    args = parser.parse_args()
+
+    if args.out:
+        if args.eg_out or args.l1_out or args.rate_out:
+            parser.error("--out can not be used with --eg_out, --l1_out or --rate_out")
+        if args.out_format!="root":
+            parser.error("--out requires --out_format root")
+        args.eg_out = args.out if "eg" in args.ntups else None
+        args.l1_out = args.out if "l1" in args.ntups else None
+        args.rate_out = args.out if "rate" in args.ntups else None
+    if not (args.eg_out or args.l1_out or args.rate_out):
+        parser.error("at least one of --out, --eg_out, --l1_out or --rate_out must be given")
+
+    weights = EvtWeights(args.weights) if args.weights else None
+    columnar_trees = []
+    def make_tree(name,filename):
+        if args.out_format=="root":
+            return None
+        tree = ColumnarWriter.ColumnarTree(name,ColumnarWriter.get_columnar_filename(filename,args.out_format),args.out_format)
+        columnar_trees.append(tree)
+        return tree
+
+    consumers = []
+    if args.eg_out:
+        def make_eghlt_tree(evtdata):
+            eghlt_tree = EgHLTTree('egHLTTree',evtdata,args.min_et,weights,tree=make_tree('egHLTTree',args.eg_out))
+            setup_eghlt_tree(eghlt_tree,evtdata)
+            return eghlt_tree
+        consumers.append(Consumer("egHLTTree",args.eg_out if args.out_format=="root" else None,
+                                  make_eghlt_tree,products=make_eghlt_products()))
+    if args.l1_out:
+        consumers.append(Consumer("l1Tree",args.l1_out,
+                                  lambda evtdata : L1Tree("l1Tree",evtdata,weights),
+                                  products=phaseII_products))
+    if args.rate_out:
+        consumers.append(Consumer("tsgRateTree",args.rate_out,
+                                  lambda evtdata : TSGRateTrees(evtdata,make_tree("tsgRateTree",args.rate_out)),
+                                  products=make_tsg_products(args.trig_res_tag)))
+
+    evt_loop = EvtLoop(consumers,verbose=True)
+    if args.prefetch>0:
+        evt_loop.evtdata.enable_learned_prefetch(args.prefetch)
+    if args.profile:
+        evt_loop.evtdata.enable_profiling()
+    evt_loop.run(args.in_filenames,args.prefix,maxevents=args.maxevents,report=args.report,entry_range=args.entry_range)
+    for tree in columnar_trees:
+        tree.Write()
+
+    print(evt_loop.get_report())
+    if args.profile:
+        print(evt_loop.evtdata.get_profile_report())
+
+if __name__ == "__main__":
+    main()
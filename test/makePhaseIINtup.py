@@ -14,7 +14,10 @@ import Analysis.HLTAnalyserPy.TrigTools as TrigTools
 import Analysis.HLTAnalyserPy.GsfTools as GsfTools
 import Analysis.HLTAnalyserPy.IsolTools as IsolTools
 import Analysis.HLTAnalyserPy.PixelMatchTools as PixelMatchTools
+import Analysis.HLTAnalyserPy.ColumnarWriter as ColumnarWriter
+import Analysis.HLTAnalyserPy.Checkpoint as Checkpoint
 from Analysis.HLTAnalyserPy.Trees import EgHLTTree
+from Analysis.HLTAnalyserPy.EvtFilters import EvtPreFilter,TrigFilter,NrEgObjsFilter,PtHatFilter
 
 def get_offline_energy(obj,evtdata):
     obj_sc = obj.superCluster()
@@ -161,39 +164,31 @@ def get_h_for_he(obj):
 def get_hsum_for_he(obj):
     return obj.var("hltEgammaHoverEUnseeded",0) + obj.var("hltEgammaHGCALIDVarsUnseeded_hForHOverE",0)
 
-def main():
-    
-    CoreTools.load_fwlitelibs();
-
-    parser = argparse.ArgumentParser(description='prints E/gamma pat::Electrons/Photons us')
-    parser.add_argument('in_filenames',nargs="+",help='input filename')
-    parser.add_argument('--out_filename','-o',default="output.root",help='output filename')
-    parser.add_argument('--min_et','-m',default=10.,type=float,help='minimum eg et') 
-    parser.add_argument('--weights','-w',default=None,help="weights filename")
-    parser.add_argument('--report','-r',default=10,type=int,help="report every N events")
-    parser.add_argument('--reg_hgcal',default=None,help='filename of file with hgcal regression')
-    parser.add_argument('--prefix','-p',default="",help='prefix to append to input files')
-    args = parser.parse_args()
-    
+def make_eghlt_products():
+    """
+    the products needed by the tree set up by setup_eghlt_tree, the phase II 
+    products plus the corrected hgcal superclusters used by energyCorrOffline
+    """
+    products = list(phaseII_products)
     #temp for regression
-    add_product(phaseII_products,"sc_hgcal_corr","vector<reco::SuperCluster>","corrHGCALSuperClus")
-    add_product(phaseII_products,"sc_hgcal_corr_features","vector<vector<float>>","corrHGCALSuperClus:features")
-    
-    
-    evtdata = EvtData(phaseII_products,verbose=True)
-    weights = EvtWeights(args.weights) if args.weights else None
-    mean_forest_hgcal = None
-    if args.reg_hgcal:
-        reg_file =  ROOT.TFile.Open(args.reg_hgcal,"READ")
-       # mean_forest_hgcal = reg_file.EECorrection
-        mean_forest_hgcal = reg_file.superclus_hgcal_mean_offline
-    
-
-    out_file = ROOT.TFile(args.out_filename,"RECREATE")
+    add_product(products,"sc_hgcal_corr","vector<reco::SuperCluster>","corrHGCALSuperClus")
+    add_product(products,"sc_hgcal_corr_features","vector<vector<float>>","corrHGCALSuperClus:features")
+    return products
 
-    eghlt_tree = EgHLTTree('egHLTTree',evtdata,args.min_et,weights)
+def setup_eghlt_tree(eghlt_tree,evtdata,mean_forest_hgcal=None):
+    """
+    adds the phase II specific variables and update functions to an EgHLTTree
+    so it can be shared by any script making the phase II ntuple
+    the evtdata must have the products of make_eghlt_products()
+    """
     # for each redefined variable, also add _validation branch, 
     # as a sanity check that our functions can reproduce default variables
+    #isolations sharing a collection are computed for all their cone sizes in a single pass
+    trkv6_iso = IsolTools.TrkIsolEngine(evtdata,"trksv6")
+    trkv72_iso = IsolTools.TrkIsolEngine(evtdata,"trksv72")
+    hgcal_iso = IsolTools.ClusIsolEngine(evtdata,"hgpfclus")
+    ecal_iso = IsolTools.ClusIsolEngine(evtdata,"ecalpfclus")
+    hcal_iso = IsolTools.ClusIsolEngine(evtdata,"hcalpfclus",veto_sc_clus=False)
     eghlt_tree.add_eg_vars({
         'hForHoverE/F' : get_h_for_he,
         'hSumForHoverE/F' : get_hsum_for_he,
@@ -201,17 +196,17 @@ def main():
         'nLayerOT/I' : GsfTools.get_nlayerstrip_gsf,
         'normChi2/F' : GsfTools.get_normchi2_gsf,
         'nGsf/I' : GsfTools.get_ngsf,
-        'hltisov6/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hlt_iso,evtdata,trkcoll="trksv6")),
-        'hltisov6_validation/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hlt_iso,evtdata,trkcoll="trksv6",min_pt=1.0,max_dz=0.15,min_deta=0.01,max_dr2=0.2*0.2,min_dr2=0.03*0.03)),
-        'hltisov72/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hlt_iso,evtdata,trkcoll="trksv72")),
-        'hltisov72_validation/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hlt_iso,evtdata,trkcoll="trksv72",min_pt=1.0,max_dz=0.15,min_deta=0.01,max_dr2=0.2*0.2,min_dr2=0.03*0.03)),
+        'hltisov6/F' : trkv6_iso.add_params(),
+        'hltisov6_validation/F' : trkv6_iso.add_params(min_pt=1.0,max_dz=0.15,min_deta=0.01,max_dr2=0.2*0.2,min_dr2=0.03*0.03),
+        'hltisov72/F' : trkv72_iso.add_params(),
+        'hltisov72_validation/F' : trkv72_iso.add_params(min_pt=1.0,max_dz=0.15,min_deta=0.01,max_dr2=0.2*0.2,min_dr2=0.03*0.03),
         'l1iso/F' : CoreTools.UnaryFunc(partial(IsolTools.get_l1_iso,evtdata)),
-        'hgcaliso/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hgcal_iso,evtdata)),
-        'hgcaliso_validation/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hgcal_iso,evtdata,min_pt=0.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.0*0.0)),
-        'ecaliso/F' : CoreTools.UnaryFunc(partial(IsolTools.get_ecal_iso,evtdata)),
-        'ecaliso_validation/F' : CoreTools.UnaryFunc(partial(IsolTools.get_ecal_iso,evtdata,min_pt=0.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.0*0.0)),
-        'hcaliso/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hcal_iso,evtdata)),
-        'hcaliso_validation/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hcal_iso,evtdata,min_pt=0.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.0*0.0)),
+        'hgcaliso/F' : hgcal_iso.add_params(min_pt=2.0,min_deta=0.0,max_dr2=0.2*0.2,min_dr2=0.0*0.0),
+        'hgcaliso_validation/F' : hgcal_iso.add_params(min_pt=0.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.0*0.0),
+        'ecaliso/F' : ecal_iso.add_params(min_pt=0.0,min_deta=0.0,max_dr2=0.2*0.2,min_dr2=0.0*0.0),
+        'ecaliso_validation/F' : ecal_iso.add_params(min_pt=0.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.0*0.0),
+        'hcaliso/F' : hcal_iso.add_params(min_pt=2.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.05*0.05),
+        'hcaliso_validation/F' : hcal_iso.add_params(min_pt=0.0,min_deta=0.0,max_dr2=0.3*0.3,min_dr2=0.0*0.0),
         'hcalH_dep1/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hcalen_depth,evtdata,depth=1)),
         'hcalH_dep2/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hcalen_depth,evtdata,depth=2)),
         'hcalH_dep3/F' : CoreTools.UnaryFunc(partial(IsolTools.get_hcalen_depth,evtdata,depth=3)),
@@ -229,17 +224,92 @@ def main():
         CoreTools.UnaryFunc(set_corr_energy_eb)
       #  CoreTools.UnaryFunc(partial(fix_hgcal_hforhe,evtdata))
     ])
+
+def main():
+    
+    CoreTools.load_fwlitelibs();
+
+    parser = argparse.ArgumentParser(description='prints E/gamma pat::Electrons/Photons us')
+    parser.add_argument('in_filenames',nargs="+",help='input filename')
+    parser.add_argument('--out_filename','-o',default="output.root",help='output filename')
+    parser.add_argument('--min_et','-m',default=10.,type=float,help='minimum eg et') 
+    parser.add_argument('--weights','-w',default=None,help="weights filename")
+    parser.add_argument('--report','-r',default=10,type=int,help="report every N events")
+    parser.add_argument('--reg_hgcal',default=None,help='filename of file with hgcal regression')
+    parser.add_argument('--prefix','-p',default="",help='prefix to append to input files')
+    parser.add_argument('--prefetch',default=0,type=int,help='if >0, learns the used products over this many events and then only prefetches those')
+    parser.add_argument('--profile',action='store_true',help='profiles the product access and prints a report at the end')
+    parser.add_argument('--filt_trigs',nargs="+",default=[],help='only keep events passing any of these triggers')
+    parser.add_argument('--filt_min_egs',default=0,type=int,help='only keep events with at least this many egs above min_et')
+    parser.add_argument('--filt_pthat',nargs=2,default=None,type=float,help='only keep events with min <= pt hat < max')
+    parser.add_argument('--out_format',default="root",choices=["root"]+list(ColumnarWriter.out_formats.keys()),help='output format, for non root formats the extension of the output filename is changed to match')
+    parser.add_argument('--flush_every',default=10000,type=int,help='for non root formats, number of events per row group / record batch')
+    parser.add_argument('--entry_range',nargs=2,default=None,type=int,help='only process the entries first nr (nr<0 is to the end) of the input, as used by ParallelRunner to split files')
+    parser.add_argument('--checkpoint_every',default=0,type=int,help='if >0, checkpoints every N events so a job which dies can be resumed by rerunning it (root output only)')
+    args = parser.parse_args()
+    if args.checkpoint_every>0 and args.out_format!="root":
+        parser.error("--checkpoint_every requires --out_format root")
+    
+    evtdata = EvtData(make_eghlt_products(),verbose=True)
+    if args.prefetch>0:
+        evtdata.enable_learned_prefetch(args.prefetch)
+    if args.profile:
+        evtdata.enable_profiling()
+    weights = EvtWeights(args.weights) if args.weights else None
+    mean_forest_hgcal = None
+    if args.reg_hgcal:
+        reg_file =  ROOT.TFile.Open(args.reg_hgcal,"READ")
+       # mean_forest_hgcal = reg_file.EECorrection
+        mean_forest_hgcal = reg_file.superclus_hgcal_mean_offline
     
 
-    events = Events(CoreTools.get_filenames(args.in_filenames,args.prefix))
+    in_filenames = CoreTools.get_filenames(args.in_filenames,args.prefix)
+    ckpt = None
+    if args.checkpoint_every>0:
+        ckpt = Checkpoint.Checkpointer(args.out_filename,in_filenames,args.checkpoint_every,args.entry_range)
+        out_file = ckpt.open()
+        eghlt_tree = EgHLTTree('egHLTTree',evtdata,args.min_et,weights)
+    elif args.out_format=="root":
+        out_file = ROOT.TFile(args.out_filename,"RECREATE")
+        eghlt_tree = EgHLTTree('egHLTTree',evtdata,args.min_et,weights)
+    else:
+        out_file = ColumnarWriter.ColumnarTree('egHLTTree',ColumnarWriter.get_columnar_filename(args.out_filename,args.out_format),args.out_format,args.flush_every)
+        eghlt_tree = EgHLTTree('egHLTTree',evtdata,args.min_et,weights,tree=out_file)
+    setup_eghlt_tree(eghlt_tree,evtdata,mean_forest_hgcal)
+
+    #cheapest filters first
+    pre_filter = EvtPreFilter()
+    if args.filt_trigs:
+        pre_filter.add_filter(TrigFilter(args.filt_trigs))
+    if args.filt_pthat:
+        pre_filter.add_filter(PtHatFilter(*args.filt_pthat))
+    if args.filt_min_egs>0:
+        eg_coll_name = "egtrigobjs_l1seed" if eghlt_tree.l1seeded else "egtrigobjs"
+        pre_filter.add_filter(NrEgObjsFilter(args.filt_min_egs,args.min_et,eg_coll_name))
+
+    events = Events(in_filenames)
     nr_events = events.size()
-    for event_nr,event in enumerate(events):
+    entry_range = args.entry_range
+    if ckpt:
+        ckpt.add_state("pre_filter",pre_filter)
+        entry_range = ckpt.start()
+    for event_nr,event in enumerate(CoreTools.iter_events(events,entry_range)):
         if event_nr%args.report==0:
             print("processing event {} / {}".format(event_nr,nr_events))
         evtdata.get_handles(event)
-        eghlt_tree.fill()
+        if pre_filter(evtdata):
+            eghlt_tree.fill()
+        if ckpt:
+            ckpt.event_done()
 
-    out_file.Write()
+    if ckpt:
+        ckpt.finish()
+    else:
+        out_file.Write()
+    if pre_filter.filters:
+        print(pre_filter.get_report())
+    if args.profile:
+        print(evtdata.get_profile_report())
 
 if __name__ == "__main__":
     main()
@@ -15,6 +15,8 @@ import Analysis.HLTAnalyserPy.GenTools as GenTools
 import Analysis.HLTAnalyserPy.HistTools as HistTools
 import Analysis.HLTAnalyserPy.TrigTools as TrigTools
 import Analysis.HLTAnalyserPy.L1Tools as L1Tools
+import Analysis.HLTAnalyserPy.ColumnarWriter as ColumnarWriter
+import Analysis.HLTAnalyserPy.Checkpoint as Checkpoint
 from Analysis.HLTAnalyserPy.CoreTools import UnaryFunc
 from Analysis.HLTAnalyserPy.NtupTools import TreeVar
 from Analysis.HLTAnalyserPy.EvtWeights import EvtWeights
@@ -59,21 +61,31 @@ class TSGHLTPathNameTree:
         if not self.initialised: 
             self._init_tree()
         
-        if self.last_runnr!=evtdata.event.eventAuxiliary().run(): 
+        if self.last_runnr!=self.evtdata.event.eventAuxiliary().run(): 
             new_hlt_menu = ROOT.std.string(get_hlt_menu(self.evtdata))
             if self.hlt_menu!=new_hlt_menu:
                 self.hlt_menu.swap(ROOT.std.string(get_hlt_menu(self.evtdata)))
                 trig_res = self.evtdata.get(self.trig_res_name) 
-                trig_names = evtdata.event.object().triggerNames(trig_res).triggerNames()
+                trig_names = self.evtdata.event.object().triggerNames(trig_res).triggerNames()
                 self.path_names.swap(trig_names)
                 self.tree.Fill()
-            self.last_runnr=evtdata.event.eventAuxiliary().run()
-            
-            
+            self.last_runnr=self.evtdata.event.eventAuxiliary().run()
+
+    def get_checkpoint_state(self):
+        return {"last_runnr" : self.last_runnr,"hlt_menu" : str(self.hlt_menu) if self.initialised else None}
+
+    def set_checkpoint_state(self,state):
+        self.last_runnr = state["last_runnr"]
+        if state["hlt_menu"] is not None:
+            if not self.initialised:
+                self._init_tree()
+            self.hlt_menu.assign(state["hlt_menu"])
+
+
 
 class TSGRateTree:
-    def __init__(self,tree_name,evtdata,trig_res_name="trig_res"):   
-        self.tree = ROOT.TTree(tree_name,'')
+    def __init__(self,tree_name,evtdata,trig_res_name="trig_res",tree=None):   
+        self.tree = tree if tree is not None else ROOT.TTree(tree_name,'')
         self.evtdata = evtdata
         self.trig_res_name = trig_res_name
         self.initialised = False
@@ -110,13 +122,13 @@ class TSGRateTree:
 
         trig_res = self.evtdata.get(self.trig_res_name) 
 
-        if self.last_runnr!=evtdata.event.eventAuxiliary().run(): 
+        if self.last_runnr!=self.evtdata.event.eventAuxiliary().run(): 
             self.hlt_menu.swap(ROOT.std.string(get_hlt_menu(self.evtdata)))
-            self.last_runnr=evtdata.event.eventAuxiliary().run()
-            trig_names = evtdata.event.object().triggerNames(trig_res).triggerNames()
+            self.last_runnr=self.evtdata.event.eventAuxiliary().run()
+            trig_names = self.evtdata.event.object().triggerNames(trig_res).triggerNames()
   #          self.hlt_bits.resize(trig_names.size())
 
-        l1_algblk = evtdata.get("algblk")
+        l1_algblk = self.evtdata.get("algblk")
         if l1_algblk:
             l1dec_initial = l1_algblk.at(0,0).getAlgoDecisionInitial()
             l1dec_final = l1_algblk.at(0,0).getAlgoDecisionFinal()
@@ -142,6 +154,21 @@ class TSGRateTree:
         
         self.tree.Fill()
 
+def make_tsg_products(trig_res_tag="TriggerResults"):
+    """
+    the products needed by the TSGRateTree and TSGHLTPathNameTree
+    """
+    products = []
+    add_product(products,"algblk","BXVector<GlobalAlgBlk>","hltGtStage2Digis")
+    add_product(products,"extblk","BXVector<GlobalExtBlk>","hltGtStage2Digis")
+    add_product(products,"egamma","BXVector<l1t::EGamma>","hltGtStage2Digis:EGamma")
+    add_product(products,"etsum","BXVector<l1t::EtSum>","hltGtStage2Digis:EtSum")
+    add_product(products,"jet","BXVector<l1t::Jet>","hltGtStage2Digis:Jet")
+    add_product(products,"muon","BXVector<l1t::Muon>","hltGtStage2Digis:Muon")
+    add_product(products,"tau","BXVector<l1t::Tau>","hltGtStage2Digis:Tau")
+    add_product(products,"trig_res","edm::TriggerResults",trig_res_tag)
+    return products
+
 if __name__ == "__main__":
     
     CoreTools.load_fwlitelibs()
@@ -150,29 +177,44 @@ if __name__ == "__main__":
     parser.add_argument('in_filenames',nargs="+",help='input filename')
     parser.add_argument('--prefix','-p',default='file:',help='file prefix')
     parser.add_argument('--out','-o',default="output.root",help='output filename')
+    parser.add_argument('--profile',action='store_true',help='profiles the product access and prints a report at the end')
+    parser.add_argument('--out_format',default="root",choices=["root"]+list(ColumnarWriter.out_formats.keys()),help='format of the rate tree, the path name tree is always written to the root file')
+    parser.add_argument('--entry_range',nargs=2,default=None,type=int,help='only process the entries first nr (nr<0 is to the end) of the input, as used by ParallelRunner to split files')
+    parser.add_argument('--checkpoint_every',default=0,type=int,help='if >0, checkpoints every N events so a job which dies can be resumed by rerunning it (root output only)')
     args = parser.parse_args()
-    std_products = []
-    add_product(std_products,"algblk","BXVector<GlobalAlgBlk>","hltGtStage2Digis")
-    add_product(std_products,"extblk","BXVector<GlobalExtBlk>","hltGtStage2Digis")
-    add_product(std_products,"egamma","BXVector<l1t::EGamma>","hltGtStage2Digis:EGamma")
-    add_product(std_products,"etsum","BXVector<l1t::EtSum>","hltGtStage2Digis:EtSum")
-    add_product(std_products,"jet","BXVector<l1t::Jet>","hltGtStage2Digis:Jet")
-    add_product(std_products,"muon","BXVector<l1t::Muon>","hltGtStage2Digis:Muon")
-    add_product(std_products,"tau","BXVector<l1t::Tau>","hltGtStage2Digis:Tau")
-    add_product(std_products,"trig_res","edm::TriggerResults","TriggerResults")
+    if args.checkpoint_every>0 and args.out_format!="root":
+        parser.error("--checkpoint_every requires --out_format root")
+    std_products = make_tsg_products()
 
     evtdata = EvtData(std_products,verbose=True)
+    if args.profile:
+        evtdata.enable_profiling()
     
-    events = Events(CoreTools.get_filenames(args.in_filenames,args.prefix))
+    in_filenames = CoreTools.get_filenames(args.in_filenames,args.prefix)
+    events = Events(in_filenames)
     nrevents = events.size()
     print("number of events",nrevents)
     trig_res = TrigTools.TrigResults(["DST_ZeroBias_v"])
-    out_file = ROOT.TFile.Open(args.out,"RECREATE")
-    rate_tree = TSGRateTree("tsgRateTree",evtdata)
+    ckpt = None
+    if args.checkpoint_every>0:
+        ckpt = Checkpoint.Checkpointer(args.out,in_filenames,args.checkpoint_every,args.entry_range)
+        out_file = ckpt.open()
+    else:
+        out_file = ROOT.TFile.Open(args.out,"RECREATE")
+    if args.out_format=="root":
+        rate_tree = TSGRateTree("tsgRateTree",evtdata)
+    else:
+        columnar_tree = ColumnarWriter.ColumnarTree("tsgRateTree",ColumnarWriter.get_columnar_filename(args.out,args.out_format),args.out_format)
+        rate_tree = TSGRateTree("tsgRateTree",evtdata,tree=columnar_tree)
     path_tree = TSGHLTPathNameTree("hltPathNameTree",evtdata)
-    count = 0
+    counts = Checkpoint.StateDict(seed=0)
     seed = 178
-    for eventnr,event in enumerate(events):
+    entry_range = args.entry_range
+    if ckpt:
+        ckpt.add_state("path_tree",path_tree)
+        ckpt.add_state("counts",counts)
+        entry_range = ckpt.start()
+    for eventnr,event in enumerate(CoreTools.iter_events(events,entry_range)):
         if eventnr%50000==0:
             print("{}/{}".format(eventnr,nrevents))
         
@@ -184,9 +226,17 @@ if __name__ == "__main__":
 
         menu = evtdata.get("algblk").at(0,0)
         if menu.getAlgoDecisionFinal()[seed]:
-            count+=1
+            counts["seed"]+=1
+        if ckpt:
+            ckpt.event_done()
             
-      
-    out_file.Write()
+    if ckpt:
+        ckpt.finish()
+    else:
+        out_file.Write()
+    if args.out_format!="root":
+        rate_tree.tree.Write()
         
-    print("count is ",count)
+    print("count is ",counts["seed"])
+    if args.profile:
+        print(evtdata.get_profile_report())
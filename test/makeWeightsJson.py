@@ -13,6 +13,7 @@ from enum import IntEnum
 from DataFormats.FWLite import Events, Handle
 from Analysis.HLTAnalyserPy.EvtData import EvtData, EvtHandles, add_product
 import Analysis.HLTAnalyserPy.CoreTools as CoreTools
+import Analysis.HLTAnalyserPy.FileMetadata as FileMetadata
 from Analysis.HLTAnalyserPy.GenTools import MCSample,MCSampleGetter
 
 
@@ -283,42 +284,121 @@ def fill_weights_dict_v2(weights_dict,nrevents,mcdata):
         
     return weights_dict
         
+_samples_cache_name = "mcsamples.json"
+
+def read_mcinfo(in_filename,mc_type_getter,evtdata):
+    """
+    gets the sample type from the first event of the file, None if it has no events
+    """
+    events = Events(in_filename)
+    if events.size()==0:
+        return None
+    events.to(0)
+    evtdata.get_handles(events)
+    return mc_type_getter.get(evtdata)
+
+def get_mcinfos(in_filenames,nr_events,per_dir=False):
+    """
+    returns a list of the MCSample of each file, the samples are cached in the
+    cache dir keyed by filename and are only read again if the file changes
+    nr_events is a dict of filename : number of events, files with no events 
+    are not opened and are assigned the sample of the previous file 
+
+    if per_dir is True, the sample is only read from the first file of each 
+    directory and assigned to the rest, this is only correct if each directory
+    has a single sample (eg a single pt hat bin), these guessed samples are 
+    marked as such in the cache and are read again when per_dir is False
+    """
+    cache_filename = os.path.join(CoreTools.get_cache_dir(),_samples_cache_name)
+    cache = {}
+    if os.path.exists(cache_filename):
+        try:
+            with open(cache_filename) as f:
+                cache = json.load(f)
+        except ValueError:
+            cache = {}
+
+    products = []
+    add_product(products,"geninfo","GenEventInfoProduct","generator")
+    evtdata = EvtData(products)
+    mc_type_getter = MCSampleGetter()
+    
+    mcinfos = []
+    dir_mcinfos = {}
+    last_mcinfo = MCSample()
+    updated = False
+    for in_filename in in_filenames:
+        if not nr_events[in_filename]:
+            print("file {} has no events, assigning it the sample of the previous file".format(in_filename))
+            mcinfos.append(last_mcinfo)
+            continue
+
+        dir_name = os.path.dirname(in_filename)
+        mtime,size = CoreTools.get_file_stats(in_filename)
+        data = cache.get(in_filename)
+        if (data and data['mtime']==mtime and data['size']==size and 
+            (per_dir or not data.get('guessed',False))):
+            mcinfo = MCSample.from_dict(data['sample'])
+        else:
+            guessed = per_dir and dir_name in dir_mcinfos
+            if guessed:
+                mcinfo = dir_mcinfos[dir_name]
+            else:
+                mcinfo = read_mcinfo(in_filename,mc_type_getter,evtdata)
+                if mcinfo is None:
+                    print("file {} has no events, assigning it the sample of the previous file".format(in_filename))
+                    mcinfos.append(last_mcinfo)
+                    continue
+            cache[in_filename] = {'mtime' : mtime,'size' : size,'sample' : mcinfo.to_dict(),
+                                  'guessed' : guessed}
+            updated = True
+        dir_mcinfos.setdefault(dir_name,mcinfo)
+        mcinfos.append(mcinfo)
+        last_mcinfo = mcinfo
+
+    if updated:
+        tmp_filename = "{}.{}.tmp".format(cache_filename,os.getpid())
+        with open(tmp_filename,"w") as f:
+            json.dump(cache,f)
+        os.rename(tmp_filename,cache_filename)
+    return mcinfos
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='tries to open every root file in sub dir')
+    parser = argparse.ArgumentParser(description='makes the weights json from the number of events in each sample')
     parser.add_argument('in_filenames',nargs="+",help='input files')
     parser.add_argument('--prefix','-p',default='file:',help='file prefix')
     parser.add_argument('--out','-o',default='weights.json',help='output weights json')
     parser.add_argument('--direct','-d',action='store_true',help='read nrtot directly from tree entries')
     parser.add_argument('--hlt_proc',default='HLTX',help='HLTX process, needed if not direct')
+    parser.add_argument('--nr_procs','-j',default=8,type=int,help='number of processes to read the event counts with')
+    parser.add_argument('--sample_per_dir',action='store_true',help='only reads the sample type from the first file of each directory, faster but wrong if a directory has several samples')
     args = parser.parse_args()
     
-    products = []
-    add_product(products,"geninfo","GenEventInfoProduct","generator")
-    
-    evtdata = EvtData(products)
-    
     in_filenames = CoreTools.get_filenames(args.in_filenames,args.prefix)
 
+    #only the Runs tree counter (or the Events tree header if direct) is read
+    #in parallel and the counts are cached
+    counter_name = FileMetadata.get_runs_counter_name(args.hlt_proc)
+    metadata = FileMetadata.get_file_metadata(in_filenames,[counter_name] if not args.direct else [],
+                                              nr_procs=args.nr_procs,verbose=True)
+    in_filenames = [x for x in in_filenames if metadata[x]['readable']]
+    for in_filename,meta in metadata.items():
+        if not meta['readable']:
+            print("file {} is not readable, skipping".format(in_filename))
+    nr_events = {x : metadata[x]['nr_events'] for x in in_filenames}
+    mcinfos = get_mcinfos(in_filenames,nr_events,args.sample_per_dir)
+
     weights_dict = {"v2" : { "dy" : [], "qcd": [], "wjets" : [] } }
-    mc_type_getter = MCSampleGetter()
-    for in_filename in in_filenames:        
-        events = Events(in_filename)          
-        if events.size()==0:      
-            print("file {}".format(in_filename),)
-            mcinfo = mc_type_getter.get(evtdata=None)
-        else:
-            events.to(0)
-            evtdata.get_handles(events)
-            mcinfo = mc_type_getter.get(evtdata)
+    com_energy = 14000.
+    for in_filename,mcinfo in zip(in_filenames,mcinfos):
         com_energy = mcinfo.com_energy
         if args.direct:
-            fill_weights_dict_v2(weights_dict["v2"],events.size(),mcinfo)
+            nr_events = metadata[in_filename]['nr_events']
         else:
-            
-            root_file = ROOT.TFile.Open(in_filename)#events.object().event().getTFile() 
-            root_file.Runs.GetEntry(0)
-            nr_events = getattr(root_file.Runs,"edmMergeableCounter_hltNrInputEvents_nrEventsRun_{proc_name}".format(proc_name=args.hlt_proc)).value 
-            fill_weights_dict_v2(weights_dict["v2"],nr_events,mcinfo)
+            nr_events = metadata[in_filename]['counters'][counter_name]
+            if nr_events is None:
+                raise AttributeError("file {} has no {} in the Runs tree".format(in_filename,counter_name))
+        fill_weights_dict_v2(weights_dict["v2"],nr_events,mcinfo)
     #we always need a MB entry so force it to be created  
     #will do nothing if already created
     fill_weights_dict_v2(weights_dict['v2'],0.,MCSample(MCSample.ProcType.MB,com_energy=com_energy))
@@ -12,58 +12,30 @@ from DataFormats.FWLite import Events, Handle
 from Analysis.HLTAnalyserPy.EvtData import EvtData, EvtHandles,phaseII_products
 import Analysis.HLTAnalyserPy.CoreTools as CoreTools
 import Analysis.HLTAnalyserPy.GenTools as GenTools
+import Analysis.HLTAnalyserPy.CollArrays as CollArrays
+import Analysis.HLTAnalyserPy.MatchTools as MatchTools
 
 def cal_trk_iso(ele_trk,trks,max_dr2,min_dr2,min_dphi,max_dz,min_pt):
 
     #an example of the cuts applied to general tracks
     #we can also add in some cuts on other track quantities later one
     #but now we just cut on pt,eta,phi and vtx
+    #trks is the CollArrays snapshot of the tracks so the cuts are applied 
+    #to all the tracks at once
     eta = ele_trk.eta()
     phi = ele_trk.phi()
     vz = ele_trk.vz() #this is the z vertex of the track, important for PU rejection
     
-    isol = 0.
-    
-    for trk in trks:
-        #note the ordering of the cuts, done so the expensive dR2 calculation is done last
-        #note that its dr*dr not dr that is calcualted to save time
-        if trk.pt()<min_pt: continue
-        dz = vz - trk.vz()
-        if abs(dz)>max_dz: continue
-        dphi = ROOT.reco.deltaPhi(phi,trk.phi())
-        if abs(dphi)<min_dphi: continue
-        dr2 = ROOT.reco.deltaR2(eta,phi,trk.eta(),trk.phi())
-        if dr2 > max_dr2 or dr2 < min_dr2: continue
-        isol+=trk.pt()
-
-    return isol
+    dphi = MatchTools.delta_phi(phi,trks['phi'])
+    deta = eta - trks['eta']
+    dr2 = deta*deta + dphi*dphi
+    passed = (trks['pt']>=min_pt) & (np.abs(vz - trks['vz'])<=max_dz) & (np.abs(dphi)>=min_dphi)
+    passed &= (dr2<=max_dr2) & (dr2>=min_dr2)
+    return float(trks['pt'][passed].sum())
 
 def cal_l1trk_iso(ele_trk,l1trks,max_dr2,min_dr2,min_dphi,max_dz,min_pt):
-
-    #an example of the cuts applied to general tracks
-    #we can also add in some cuts on other track quantities later one
-    #but now we just cut on pt,eta,phi and vtx
-    eta = ele_trk.eta()
-    phi = ele_trk.phi()
-    vz = ele_trk.vz() #this is the z vertex of the track, important for PU rejection
-
-    isol = 0.
-
-    for l1trk_extra in l1trks:
-        #note the ordering of the cuts, done so the expensive dR2 calculation is done last
-        #note that its dr*dr not dr that is calculated to save time
-        l1trk = l1trk_extra.ttTrk()
-        pt = l1trk.momentum().perp()
-        if pt <min_pt: continue
-        dz = vz - l1trk.z0()
-        if abs(dz)>max_dz: continue
-        dphi = ROOT.reco.deltaPhi(phi,l1trk.phi())
-        if abs(dphi)<min_dphi: continue
-        dr2 = ROOT.reco.deltaR2(eta,phi,l1trk.eta(),l1trk.phi())
-        if dr2 > max_dr2 or dr2 < min_dr2: continue
-        isol+=pt
-
-    return isol
+    #the l1trks snapshot has the same fields as the tracks (vz is the z0 of the TTTrack)
+    return cal_trk_iso(ele_trk,l1trks,max_dr2,min_dr2,min_dphi,max_dz,min_pt)
 
 
 
@@ -127,9 +99,9 @@ if __name__ == "__main__":
 
                 for A in range(1,11,1):
                     #taking the first gsf track entry for now
-                    trk_isol_v0  = cal_trk_iso(egobj.gsfTracks()[0],evtdata.handles.trksv0.product(),max_dr2=0.2*0.2,min_dr2=0.03*0.03,min_dphi=0.01,max_dz=A*0.1,min_pt=1)
-                    #trk_isol_v2  = cal_trk_iso(egobj.gsfTracks()[0],evtdata.handles.trksv2.product(),max_dr2=0.2*0.2,min_dr2=0.03*0.03,min_dphi=0.01,max_dz=0.1,min_pt=1)
-                    trk_isol_l1 =  cal_l1trk_iso(egobj.gsfTracks()[0],evtdata.handles.l1trks.product(),max_dr2=0.2*0.2,min_dr2=0.03*0.03,min_dphi=0.01,max_dz=A*0.1,min_pt=1)
+                    trk_isol_v0  = cal_trk_iso(egobj.gsfTracks()[0],CollArrays.get_coll_arrays(evtdata,"trksv0"),max_dr2=0.2*0.2,min_dr2=0.03*0.03,min_dphi=0.01,max_dz=A*0.1,min_pt=1)
+                    #trk_isol_v2  = cal_trk_iso(egobj.gsfTracks()[0],CollArrays.get_coll_arrays(evtdata,"trksv2"),max_dr2=0.2*0.2,min_dr2=0.03*0.03,min_dphi=0.01,max_dz=0.1,min_pt=1)
+                    trk_isol_l1 =  cal_l1trk_iso(egobj.gsfTracks()[0],CollArrays.get_coll_arrays(evtdata,"l1trks"),max_dr2=0.2*0.2,min_dr2=0.03*0.03,min_dphi=0.01,max_dz=A*0.1,min_pt=1)
                     if (egobj.gsfTracks()[0].eta() < abs(1.5)):
                        L1signalB[A-1]+=1
                        L1isohistB[A-1].Fill( trk_isol_l1, weight )